@@ -1,14 +1,15 @@
 import imaplib
-import email
-from email.header import decode_header
+import logging
 import os
 import pandas as pd
 import streamlit as st
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.llms import Ollama
-from langchain.chains import RetrievalQA
+from instrumentation import count, log_event, timed
+from mail_ingest import PO_RULE, connect_imap, download_attachments
+from indexer import replace_source
+from vector_backends import get_backend
+from rag_stream import answer_rag, write_streaming_answer
 
 # Email Configuration
 IMAP_SERVER = "imap.gmail.com"
@@ -26,40 +27,30 @@ EMAIL_PASSWORD = st.secrets["EMAIL_PASSWORD"]
 def clean_filename(filename):
     return filename.replace(" ", "_").replace("/", "_")
 
+def save_po_dump(filename, payload):
+    filepath = os.path.join(PO_DIRECTORY, filename)
+    with open(filepath, "wb") as f:
+        f.write(payload)
+    print(f"Saved: {filepath}")
+
 # Download PO Dump Emails and Save to Excel
 def download_po_dump():
     os.makedirs(PO_DIRECTORY, exist_ok=True)
-    try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-        mail.login(EMAIL_ACCOUNT, EMAIL_PASSWORD)
-        mail.select("inbox")
-        
-        status, email_ids = mail.search(None, '(SUBJECT "PO Order")')
-
-        if status == "OK":
-            email_ids = email_ids[0].split()[-10:]  # Get last 10 emails
-            for e_id in email_ids:
-                status, msg_data = mail.fetch(e_id, "(RFC822)")
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        for part in msg.walk():
-                            if part.get_content_disposition() == "attachment":
-                                filename = part.get_filename()
-                                if filename and filename.endswith(".xlsx"):
-                                    filename = decode_header(filename)[0][0]
-                                    if isinstance(filename, bytes):
-                                        filename = filename.decode()
-
-                                    filepath = os.path.join(PO_DIRECTORY, clean_filename(filename))
-                                    with open(filepath, "wb") as f:
-                                        f.write(part.get_payload(decode=True))
-                                    print(f"Saved: {filepath}")
-        mail.logout()
-    except Exception as e:
-        print(f"Error: {e}")
+    with timed("download_job", corpus="po"):
+        try:
+            mail = connect_imap(EMAIL_ACCOUNT, EMAIL_PASSWORD, IMAP_SERVER)
+        except (imaplib.IMAP4.error, OSError) as e:
+            # Gmail being unreachable should not stop the app answering from the files it already has
+            count("download_jobs_failed_total", corpus="po")
+            log_event("download_failed", level=logging.ERROR, exc_info=True, corpus="po", error=repr(e))
+            st.error(f"Could not fetch new PO emails: {e}")
+            return
+        try:
+            download_attachments(mail, PO_RULE, save_po_dump, clean_filename)
+        finally:
+            mail.logout()
 
-# Extract Text from Excel Files
+# Extract Text from Excel Files: (filename, text) per workbook
 def extract_po_data():
     all_texts = []
     for filename in os.listdir(PO_DIRECTORY):
@@ -67,7 +58,7 @@ def extract_po_data():
             filepath = os.path.join(PO_DIRECTORY, filename)
             df = pd.read_excel(filepath)
             text = df.to_string()
-            all_texts.append(text)
+            all_texts.append((filename, text))
     print(f"Extracted {len(all_texts)} text chunks from PO dumps.")
     return all_texts
 
@@ -78,18 +69,20 @@ def create_po_vector_store(documents):
         return None
     
     embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vector_store = FAISS.from_texts(documents, embeddings)
-    vector_store.save_local(FAISS_INDEX_PATH)
-    return vector_store
+    # Through the indexer so the write takes the same lock as the watcher / work queue, replaces older
+    # versions of a re-downloaded workbook and only embeds what changed
+    for filename, text in documents:
+        replace_source("po", filename, [text], embeddings)
+    return get_backend("po", embeddings, index_path=FAISS_INDEX_PATH)
 
 # Load or Create FAISS Index for PO Dumps
 @st.cache_resource
 def get_po_vector_store():
-    if os.path.exists(FAISS_INDEX_PATH):
-        st.info("Loading existing PO FAISS index...")
-        return FAISS.load_local(FAISS_INDEX_PATH,
-                                HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),
-                                allow_dangerous_deserialization=True)
+    vector_store = get_backend("po", HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),
+                               index_path=FAISS_INDEX_PATH)
+    if vector_store.available():
+        st.info(f"Loading existing PO index ({vector_store.name})...")
+        return vector_store
     
     documents = extract_po_data()
     return create_po_vector_store(documents)
@@ -100,11 +93,7 @@ def query_po_rag(query):
     if not vector_store:
         return "Index not found. Please build the index first."
     
-    retriever = vector_store.as_retriever()
-    llm = Ollama(model="llama2:latest")  # Using Llama2
-    chain = RetrievalQA.from_chain_type(llm, retriever=retriever)
-    
-    return chain.run(query)
+    return answer_rag(vector_store, query)["answer"]
 
 # Streamlit UI
 st.title("RAG System for PO Dump Analysis")
@@ -115,5 +104,9 @@ create_po_vector_store(documents)
 
 query = st.text_input("Enter your query about PO Orders:")
 if query:
-    answer = query_po_rag(query)
-    st.write("Answer:", answer)
+    vector_store = get_po_vector_store()
+    if not vector_store:
+        st.write("Answer:", "Index not found. Please build the index first.")
+    else:
+        # Stream tokens into the page as Llama2 produces them
+        write_streaming_answer(vector_store, query)
@@ -3,17 +3,17 @@
 
 
 import imaplib
-import email
-from email.header import decode_header
+import logging
 import os
 import boto3
 import pandas as pd
 import streamlit as st
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.llms import Ollama
-from langchain.chains import RetrievalQA
+from instrumentation import count, log_event, timed
+from mail_ingest import PO_RULE, connect_imap, download_attachments
+from chunk_store import build_vector_store_from_texts, open_vector_store, vector_store_exists
+from rag_stream import answer_rag, write_streaming_answer
 import tempfile
 
 # AWS S3 Configuration
@@ -43,42 +43,33 @@ s3_client = boto3.client(
 def clean_filename(filename):
     return filename.replace(" ", "_").replace("/", "_")
 
+def save_po_dump(filename, payload):
+    filepath = os.path.join(PO_DIRECTORY, filename)
+    with open(filepath, "wb") as f:
+        f.write(payload)
+
+    # Upload to S3
+    s3_key = f"po_dumps/{filename}"
+    with timed("s3_upload"):
+        s3_client.upload_file(filepath, S3_BUCKET_NAME, s3_key)
+    print(f"Uploaded to S3: {s3_key}")
+
 # Download PO Dump Emails and Save to Excel
 def download_po_dump():
     os.makedirs(PO_DIRECTORY, exist_ok=True)
-    try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-        mail.login(EMAIL_ACCOUNT, EMAIL_PASSWORD)
-        mail.select("inbox")
-        
-        status, email_ids = mail.search(None, '(SUBJECT "PO Order")')
-
-        if status == "OK":
-            email_ids = email_ids[0].split()[-10:]  # Get last 10 emails
-            for e_id in email_ids:
-                status, msg_data = mail.fetch(e_id, "(RFC822)")
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        for part in msg.walk():
-                            if part.get_content_disposition() == "attachment":
-                                filename = part.get_filename()
-                                if filename and filename.endswith(".xlsx"):
-                                    filename = decode_header(filename)[0][0]
-                                    if isinstance(filename, bytes):
-                                        filename = filename.decode()
-
-                                    filepath = os.path.join(PO_DIRECTORY, clean_filename(filename))
-                                    with open(filepath, "wb") as f:
-                                        f.write(part.get_payload(decode=True))
-                                    
-                                    # Upload to S3
-                                    s3_key = f"po_dumps/{clean_filename(filename)}"
-                                    s3_client.upload_file(filepath, S3_BUCKET_NAME, s3_key)
-                                    print(f"Uploaded to S3: {s3_key}")
-        mail.logout()
-    except Exception as e:
-        print(f"Error: {e}")
+    with timed("download_job", corpus="po"):
+        try:
+            mail = connect_imap(EMAIL_ACCOUNT, EMAIL_PASSWORD, IMAP_SERVER)
+        except (imaplib.IMAP4.error, OSError) as e:
+            # Gmail being unreachable should not stop the app answering from the files it already has
+            count("download_jobs_failed_total", corpus="po")
+            log_event("download_failed", level=logging.ERROR, exc_info=True, corpus="po", error=repr(e))
+            st.error(f"Could not fetch new PO emails: {e}")
+            return
+        try:
+            download_attachments(mail, PO_RULE, save_po_dump, clean_filename)
+        finally:
+            mail.logout()
 
 # Extract Text from Excel Files
 def extract_po_data():
@@ -113,11 +104,10 @@ def create_po_vector_store(documents):
         return None
     
     embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vector_store = FAISS.from_texts(documents, embeddings)
 
-    # Save FAISS index to temp file
+    # Save FAISS index and chunk store to temp dir
     temp_faiss_path = os.path.join(tempfile.gettempdir(), "faiss_index")
-    vector_store.save_local(temp_faiss_path)
+    vector_store = build_vector_store_from_texts(temp_faiss_path, documents, embeddings)
 
     # Upload FAISS index to S3
     for file in os.listdir(temp_faiss_path):
@@ -146,11 +136,11 @@ def get_po_vector_store():
                 s3_client.download_file(S3_BUCKET_NAME, s3_key, os.path.join(temp_faiss_path, filename))
                 print(f"Downloaded FAISS index from S3: {s3_key}")
 
-    if os.path.exists(temp_faiss_path):
+    if vector_store_exists(temp_faiss_path):
         st.info("Loading existing PO FAISS index from S3...")
-        return FAISS.load_local(temp_faiss_path,
-                                HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),
-                                allow_dangerous_deserialization=True)
+        return open_vector_store(temp_faiss_path,
+                                 HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),
+                                 read_only=True)
     
     documents = extract_po_data()
     return create_po_vector_store(documents)
@@ -161,11 +151,7 @@ def query_po_rag(query):
     if not vector_store:
         return "Index not found. Please build the index first."
     
-    retriever = vector_store.as_retriever()
-    llm = Ollama(model="llama2:latest")  # Using Llama2
-    chain = RetrievalQA.from_chain_type(llm, retriever=retriever)
-    
-    return chain.run(query)
+    return answer_rag(vector_store, query)["answer"]
 
 # Streamlit UI
 st.title("RAG System for PO Dump Analysis")
@@ -176,5 +162,9 @@ create_po_vector_store(documents)
 
 query = st.text_input("Enter your query about PO Orders:")
 if query:
-    answer = query_po_rag(query)
-    st.write("Answer:", answer)
+    vector_store = get_po_vector_store()
+    if not vector_store:
+        st.write("Answer:", "Index not found. Please build the index first.")
+    else:
+        # Stream tokens into the page as Llama2 produces them
+        write_streaming_answer(vector_store, query)
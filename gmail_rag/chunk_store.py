@@ -0,0 +1,269 @@
+#This module replaces FAISS.save_local / load_local (which pickles the whole LangChain docstore) with a compact
+# on-disk layout: the raw FAISS index (index.faiss, written with faiss.write_index) next to a SQLite chunk store
+# (chunks.sqlite) that maps vector positions to chunk text and metadata. Chunks are read lazily, so a search only
+# touches the top-k rows, startup no longer scales with total chunk text and nothing is ever unpickled.
+#
+# Existing pickled indexes are converted once with:  python chunk_store.py migrate po_faiss_index proforma_faiss_index
+
+import json
+import os
+import sqlite3
+import sys
+import threading
+from collections.abc import MutableMapping
+
+import faiss
+import numpy as np
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+
+INDEX_FILE = "index.faiss"
+CHUNKS_FILE = "chunks.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    doc_id   TEXT PRIMARY KEY,
+    text     TEXT NOT NULL,
+    metadata TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS positions (
+    pos    INTEGER PRIMARY KEY,
+    doc_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS positions_doc_id ON positions (doc_id);
+"""
+
+
+class ChunkDB:
+    """One SQLite connection shared by the docstore and the position map of a vector store.
+
+    Writes stay in an open transaction until commit(), which save_vector_store calls right before the index
+    file is replaced, so chunk rows and vectors are published together.
+    """
+
+    def __init__(self, path, read_only=False):
+        self.path = path
+        if read_only:
+            self.conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, check_same_thread=False)
+        else:
+            self.conn = sqlite3.connect(path, check_same_thread=False)
+            self.conn.executescript(SCHEMA)
+            self.conn.commit()
+        # QueryService searches corpora from a thread pool
+        self.lock = threading.Lock()
+
+    def execute(self, sql, params=()):
+        with self.lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def executemany(self, sql, rows):
+        with self.lock:
+            self.conn.executemany(sql, rows)
+
+    def commit(self):
+        with self.lock:
+            self.conn.commit()
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    """LangChain docstore backed by the chunks table; documents are read one row at a time."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def search(self, search):
+        rows = self.db.execute("SELECT text, metadata FROM chunks WHERE doc_id = ?", (search,))
+        if not rows:
+            return f"ID {search} not found."
+        text, metadata = rows[0]
+        return Document(id=search, page_content=text, metadata=json.loads(metadata))
+
+    def add(self, texts):
+        self.db.executemany(
+            "INSERT OR REPLACE INTO chunks (doc_id, text, metadata) VALUES (?, ?, ?)",
+            [(doc_id, doc.page_content, json.dumps(doc.metadata, default=str)) for doc_id, doc in texts.items()],
+        )
+
+    def delete(self, ids):
+        self.db.executemany("DELETE FROM chunks WHERE doc_id = ?", [(doc_id,) for doc_id in ids])
+
+
+class PositionMap(MutableMapping):
+    """Drop-in for FAISS.index_to_docstore_id: vector position -> doc id, looked up in SQLite on demand."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __getitem__(self, pos):
+        rows = self.db.execute("SELECT doc_id FROM positions WHERE pos = ?", (int(pos),))
+        if not rows:
+            raise KeyError(pos)
+        return rows[0][0]
+
+    def __setitem__(self, pos, doc_id):
+        self.db.execute("INSERT OR REPLACE INTO positions (pos, doc_id) VALUES (?, ?)", (int(pos), doc_id))
+
+    def __delitem__(self, pos):
+        self.db.execute("DELETE FROM positions WHERE pos = ?", (int(pos),))
+
+    def __iter__(self):
+        return iter([row[0] for row in self.db.execute("SELECT pos FROM positions ORDER BY pos")])
+
+    def __len__(self):
+        return self.db.execute("SELECT COUNT(*) FROM positions")[0][0]
+
+    def update(self, other=(), **kwargs):
+        rows = [(int(pos), doc_id) for pos, doc_id in dict(other, **kwargs).items()]
+        self.db.executemany("INSERT OR REPLACE INTO positions (pos, doc_id) VALUES (?, ?)", rows)
+
+    def existing_doc_ids(self, doc_ids):
+        """The subset of doc_ids that already have a vector in the index."""
+        found = set()
+        doc_ids = list(doc_ids)
+        for start in range(0, len(doc_ids), 500):  # stay under SQLite's bound-parameter limit
+            batch = doc_ids[start:start + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.db.execute(f"SELECT doc_id FROM positions WHERE doc_id IN ({placeholders})", batch)
+            found.update(row[0] for row in rows)
+        return found
+
+
+def vector_store_exists(path):
+    return os.path.exists(os.path.join(path, INDEX_FILE)) and os.path.exists(os.path.join(path, CHUNKS_FILE))
+
+
+def _wrap(index, db, embeddings):
+    return FAISS(embeddings, index, SQLiteDocstore(db), PositionMap(db))
+
+
+def open_vector_store(path, embeddings, read_only=False):
+    """Open an index written by save_vector_store.
+
+    read_only memory-maps the FAISS index where the index type allows it, so several query processes share the
+    OS page cache instead of each holding a private copy; such a store cannot be added to.
+    """
+    index_file = os.path.join(path, INDEX_FILE)
+    if read_only:
+        try:
+            index = faiss.read_index(index_file, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+        except RuntimeError:
+            index = faiss.read_index(index_file)
+        return _wrap(index, ChunkDB(os.path.join(path, CHUNKS_FILE), read_only=True), embeddings)
+
+    index = faiss.read_index(index_file)
+    db = ChunkDB(os.path.join(path, CHUNKS_FILE))
+    # Positions past the end of the index belong to a save that crashed before the index was written
+    db.execute("DELETE FROM positions WHERE pos >= ?", (index.ntotal,))
+    db.commit()
+    return _wrap(index, db, embeddings)
+
+
+def create_vector_store(path, embeddings, dimension=None):
+    """Start an empty store at path (replacing any chunk store already there)."""
+    os.makedirs(path, exist_ok=True)
+    chunks_path = os.path.join(path, CHUNKS_FILE)
+    if os.path.exists(chunks_path):
+        os.remove(chunks_path)
+    dimension = dimension or len(embeddings.embed_query("dimension probe"))
+    return _wrap(faiss.IndexFlatL2(dimension), ChunkDB(chunks_path), embeddings)
+
+
+def build_vector_store(path, text_embeddings, embeddings, metadatas=None, ids=None):
+    """Counterpart of FAISS.from_embeddings + save_local."""
+    vector_store = create_vector_store(path, embeddings, dimension=len(text_embeddings[0][1]))
+    vector_store.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+    save_vector_store(vector_store, path)
+    return vector_store
+
+
+def build_vector_store_from_texts(path, texts, embeddings, metadatas=None):
+    """Counterpart of FAISS.from_texts + save_local."""
+    vectors = embeddings.embed_documents(texts)
+    return build_vector_store(path, list(zip(texts, vectors)), embeddings, metadatas=metadatas)
+
+
+def save_vector_store(vector_store, path):
+    """Commit pending chunk rows, then atomically replace the index file.
+
+    If the process dies in between, open_vector_store drops the positions the index never received.
+    """
+    vector_store.docstore.db.commit()
+    index_file = os.path.join(path, INDEX_FILE)
+    tmp_file = f"{index_file}.tmp"
+    faiss.write_index(vector_store.index, tmp_file)
+    os.replace(tmp_file, index_file)
+
+
+def source_doc_ids(db, source):
+    """Doc ids of the chunks whose metadata has this source (the attachment they were extracted from)."""
+    return {row[0] for row in db.execute("SELECT doc_id FROM chunks WHERE json_extract(metadata, '$.source') = ?",
+                                         (source,))}
+
+
+def delete_chunks(path, doc_ids):
+    """Remove chunks and their vectors. Later vectors move down, so both files are rewritten and swapped in.
+
+    Searchers that already opened the store keep reading the old (consistent) pair of files until they reopen it;
+    the chunk store is replaced first because refreshes are triggered by the index file changing.
+    """
+    index_file, chunks_file = os.path.join(path, INDEX_FILE), os.path.join(path, CHUNKS_FILE)
+    doc_ids = set(doc_ids)
+    index = faiss.read_index(index_file)
+    db = ChunkDB(chunks_file, read_only=True)
+    try:
+        rows = db.execute("SELECT pos, doc_id FROM positions WHERE pos < ? ORDER BY pos", (index.ntotal,))
+    finally:
+        db.close()
+    removed = [pos for pos, doc_id in rows if doc_id in doc_ids]
+    if not removed:
+        return 0
+    index.remove_ids(np.asarray(removed, dtype=np.int64))
+
+    tmp_chunks = f"{chunks_file}.tmp"
+    if os.path.exists(tmp_chunks):
+        os.remove(tmp_chunks)
+    db = ChunkDB(tmp_chunks)
+    try:
+        db.execute("ATTACH DATABASE ? AS old", (chunks_file,))
+        db.execute("INSERT INTO chunks SELECT * FROM old.chunks")
+        db.commit()
+        db.execute("DETACH DATABASE old")
+        db.executemany("DELETE FROM chunks WHERE doc_id = ?", [(doc_id,) for doc_id in doc_ids])
+        db.executemany("INSERT INTO positions (pos, doc_id) VALUES (?, ?)",
+                       list(enumerate(doc_id for _, doc_id in rows if doc_id not in doc_ids)))
+        db.commit()
+    finally:
+        db.close()
+    tmp_index = f"{index_file}.tmp"
+    faiss.write_index(index, tmp_index)
+    os.replace(tmp_chunks, chunks_file)
+    os.replace(tmp_index, index_file)
+    return len(removed)
+
+
+def migrate(path, embeddings=None):
+    """Convert an index written by FAISS.save_local into the chunk store layout (the last pickle load)."""
+    pickle_file = os.path.join(path, "index.pkl")
+    if not os.path.exists(pickle_file):
+        print(f"{path}: no index.pkl, nothing to migrate")
+        return
+    legacy = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    vector_store = _wrap(legacy.index, ChunkDB(os.path.join(path, CHUNKS_FILE)), embeddings)
+    vector_store.docstore.add(
+        {doc_id: legacy.docstore.search(doc_id) for doc_id in legacy.index_to_docstore_id.values()})
+    vector_store.index_to_docstore_id.update(legacy.index_to_docstore_id)
+    save_vector_store(vector_store, path)
+    os.replace(pickle_file, f"{pickle_file}.migrated")
+    print(f"{path}: migrated {legacy.index.ntotal} chunks to {CHUNKS_FILE}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "migrate":
+        sys.exit("usage: python chunk_store.py migrate <index_dir> [<index_dir> ...]")
+    for index_path in sys.argv[2:]:
+        migrate(index_path)
@@ -0,0 +1,164 @@
+#This module packs retrieved chunks into Llama2's context window: it drops duplicate / overlapping chunks,
+# keeps them in retrieval order, compresses df.to_string() tables down to the rows relevant to the query
+# and truncates to a token budget, so prompt evaluation on the Ollama host stays cheap.
+
+import hashlib
+import re
+from collections import Counter
+
+# Llama2 has a 4096 token window; leave room for the prompt template and the generated answer
+CONTEXT_TOKEN_BUDGET = 2048
+CHARS_PER_TOKEN = 4  # rough average for Llama2's tokenizer on English / tabular text
+MIN_TRUNCATED_TOKENS = 64  # don't bother appending a chunk cut shorter than this
+DUPLICATE_THRESHOLD = 0.8  # shingle overlap above which a chunk counts as a near-duplicate
+SHINGLE_SIZE = 5
+
+TABLE_ROW_PATTERN = re.compile(r"\S\s{2,}\S")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    """Cheap token estimate; good enough for budgeting without loading a tokenizer."""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def query_terms(query):
+    """Lower-cased query words worth matching (skips 1-2 letter words)."""
+    return {w for w in WORD_PATTERN.findall(query.lower()) if len(w) > 2}
+
+
+def is_table_text(text):
+    """True for text that looks like a df.to_string() dump (space-aligned columns)."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    if len(lines) < 3:
+        return False
+    aligned = sum(1 for line in lines if TABLE_ROW_PATTERN.search(line))
+    return aligned / len(lines) >= 0.6
+
+
+def _column_edges(lines, width):
+    """Right edges of the columns in the full-width lines of a df.to_string() dump.
+
+    Cells are right-justified, so every row ends a word at each column edge; the index is left-justified,
+    so its edge is the furthest end of a row's first word.
+    """
+    rows = [line for line in lines if len(line) == width]
+    if not rows:
+        return []
+    word_ends = ({i for i, char in enumerate(line) if char != " " and (i + 1 == width or line[i + 1] == " ")}
+                 for line in rows)
+    edges = set.intersection(*word_ends)
+    edges.add(max((line + " ").index(" ", len(line) - len(line.lstrip())) - 1 for line in rows))
+    return sorted(edges)
+
+
+def _split_table_line(line, edges, width):
+    """Cells of one df.to_string() line; lines that don't fit the layout fall back to splitting on wide gaps."""
+    if not edges or len(line) != width:
+        return re.split(r"\s{2,}", line.strip())
+    starts = [0] + [edge + 1 for edge in edges[:-1]]
+    return [line[start:edge + 1].strip() for start, edge in zip(starts, edges)]
+
+
+def compress_table_text(text, terms):
+    """Collapse column padding, blank out NaN cells and move rows matching the query terms to the top.
+
+    Cells are cut at the column edges rather than dropped, so the header (whose index column is blank) and
+    rows with missing values stay aligned.
+    """
+    lines = [line for line in text.splitlines() if line.strip()]
+    width = Counter(len(line) for line in lines).most_common(1)[0][0]
+    lines[0] = lines[0].rjust(width)  # the text splitter strips the leading padding of a chunk's first line
+    edges = _column_edges(lines[1:], width)
+    compact = []
+    for line in lines:
+        cells = ["" if cell == "NaN" else cell for cell in _split_table_line(line, edges, width)]
+        compact.append(" | ".join(cells))
+
+    header, rows = compact[0], compact[1:]
+    if terms:
+        matching = [row for row in rows if terms & set(WORD_PATTERN.findall(row.lower()))]
+        others = [row for row in rows if not terms & set(WORD_PATTERN.findall(row.lower()))]
+        rows = matching + others
+    return "\n".join([header] + rows)
+
+
+def _shingles(text):
+    words = WORD_PATTERN.findall(text.lower())
+    if len(words) < SHINGLE_SIZE:
+        return {" ".join(words)}
+    return {" ".join(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def dedupe_chunks(docs):
+    """Drop exact duplicates and chunks mostly contained in an already kept chunk."""
+    kept, kept_shingles, seen_hashes = [], [], set()
+    duplicates = 0
+    for doc in docs:
+        normalized = " ".join(doc.page_content.split()).lower()
+        digest = hashlib.sha1(normalized.encode()).hexdigest()
+        if digest in seen_hashes:
+            duplicates += 1
+            continue
+        shingles = _shingles(normalized)
+        if any(len(shingles & other) / len(shingles) >= DUPLICATE_THRESHOLD for other in kept_shingles):
+            duplicates += 1
+            continue
+        seen_hashes.add(digest)
+        kept_shingles.append(shingles)
+        kept.append(doc)
+    return kept, duplicates
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text to roughly max_tokens, preferring a line boundary."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    newline = cut.rfind("\n")
+    return cut[:newline] if newline > max_chars // 2 else cut
+
+
+def assemble_context(query, docs_and_scores, max_tokens=CONTEXT_TOKEN_BUDGET, compress_tables=True):
+    """Pack (doc, score) pairs from similarity_search_with_score into a context string.
+
+    Returns (context, used_docs, stats). FAISS scores are L2 distances, so lower is better.
+    """
+    ranked = [doc for doc, _ in sorted(docs_and_scores, key=lambda pair: pair[1])]
+    unique, duplicates = dedupe_chunks(ranked)
+    terms = query_terms(query)
+
+    parts, used_docs = [], []
+    input_tokens = sum(estimate_tokens(doc.page_content) for doc in ranked)
+    remaining = max_tokens
+    truncated = 0
+    for doc in unique:
+        text = doc.page_content
+        if compress_tables and is_table_text(text):
+            text = compress_table_text(text, terms)
+        if not text.strip():
+            continue
+        tokens = estimate_tokens(text)
+        if tokens > remaining:
+            if remaining < MIN_TRUNCATED_TOKENS:
+                break
+            text = truncate_to_tokens(text, remaining)
+            tokens = estimate_tokens(text)
+            truncated += 1
+        parts.append(text)
+        used_docs.append(doc)
+        remaining -= tokens
+        if remaining < MIN_TRUNCATED_TOKENS:
+            break
+
+    context = "\n\n".join(parts)
+    stats = {
+        "retrieved_chunks": len(ranked),
+        "duplicate_chunks": duplicates,
+        "used_chunks": len(used_docs),
+        "truncated_chunks": truncated,
+        "input_tokens": input_tokens,
+        "context_tokens": estimate_tokens(context),
+    }
+    return context, used_docs, stats
@@ -0,0 +1,41 @@
+#This module turns downloaded attachments into text for indexing: PO dump workbooks via pandas,
+# proforma invoice PDFs via pdfplumber, split with the same chunking the RAG apps use.
+
+import pandas as pd
+import pdfplumber
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from instrumentation import timed
+
+CHUNK_SIZE = 500
+CHUNK_OVERLAP = 50
+
+
+def excel_to_text(path):
+    """Read a PO dump workbook and render it as text."""
+    with timed("extract_excel"):
+        df = pd.read_excel(path)
+        return df.to_string()
+
+
+def pdf_to_text(path):
+    """Extract text from every page of a PDF."""
+    text = ""
+    with timed("extract_pdf"), pdfplumber.open(path) as pdf:
+        for page in pdf.pages:
+            text += (page.extract_text() or "") + "\n"
+    return text
+
+
+def extract_text(path):
+    """Dispatch on file extension."""
+    if path.lower().endswith(".xlsx"):
+        return excel_to_text(path)
+    if path.lower().endswith(".pdf"):
+        return pdf_to_text(path)
+    raise ValueError(f"Unsupported attachment type: {path}")
+
+
+def split_text(text, chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP):
+    """Split text into overlapping chunks for embedding."""
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    return text_splitter.split_text(text)
@@ -0,0 +1,143 @@
+#This module is a tiny in-process IMAP server for benchmarks and local runs. It understands just the commands
+# imaplib sends for our ingestion flow (LOGIN, SELECT, [UID] SEARCH SUBJECT, [UID] FETCH RFC822, IDLE, LOGOUT).
+# Messages are numbered from 1 and their UID equals their sequence number.
+
+import re
+import select
+import socketserver
+import threading
+
+SUBJECT_PATTERN = re.compile(r'SUBJECT "([^"]*)"', re.IGNORECASE)
+UID_RANGE_PATTERN = re.compile(r"UID (\d+):\*", re.IGNORECASE)
+
+
+class FakeImapServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 0)):
+        super().__init__(address, FakeImapHandler)
+        self.messages = []  # (subject, raw bytes)
+        self.lock = threading.Lock()
+        self.new_message = threading.Condition(self.lock)
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def add_message(self, subject, raw):
+        """Append a message to the inbox and return its UID."""
+        with self.lock:
+            self.messages.append((subject, raw))
+            self.new_message.notify_all()
+            return len(self.messages)
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+
+class FakeImapHandler(socketserver.StreamRequestHandler):
+
+    reported = 0  # message count this connection has been told about
+
+    def send(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def announce(self):
+        """Report mail that arrived since the last EXISTS as an untagged response, as real servers do."""
+        with self.server.lock:
+            count = len(self.server.messages)
+        if count != self.reported:
+            self.reported = count
+            self.send(f"* {count} EXISTS")
+
+    def handle(self):
+        self.send("* OK [CAPABILITY IMAP4rev1 IDLE] fake IMAP ready")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            parts = line.decode().rstrip("\r\n").split(" ", 2)
+            if len(parts) < 2:
+                continue
+            tag, command = parts[0], parts[1].upper()
+            args = parts[2] if len(parts) > 2 else ""
+            use_uid = command == "UID"
+            if use_uid:
+                command, _, args = args.partition(" ")
+                command = command.upper()
+
+            handler = getattr(self, f"do_{command}", None)
+            if handler is None:
+                self.send(f"{tag} BAD unknown command {command}")
+                continue
+            if handler(tag, args) is False:
+                return
+
+    def do_CAPABILITY(self, tag, args):
+        self.send("* CAPABILITY IMAP4rev1 IDLE")
+        self.send(f"{tag} OK CAPABILITY completed")
+
+    def do_LOGIN(self, tag, args):
+        self.send(f"{tag} OK LOGIN completed")
+
+    def do_SELECT(self, tag, args):
+        with self.server.lock:
+            count = len(self.server.messages)
+        self.reported = count
+        self.send(f"* {count} EXISTS")
+        self.send("* 0 RECENT")
+        self.send("* OK [UIDVALIDITY 1] UIDs valid")
+        self.send(f"* OK [UIDNEXT {count + 1}] Predicted next UID")
+        self.send(f"{tag} OK [READ-WRITE] SELECT completed")
+
+    def do_NOOP(self, tag, args):
+        self.announce()
+        self.send(f"{tag} OK NOOP completed")
+
+    def do_CLOSE(self, tag, args):
+        self.send(f"{tag} OK CLOSE completed")
+
+    def do_SEARCH(self, tag, args):
+        subject = SUBJECT_PATTERN.search(args)
+        uid_range = UID_RANGE_PATTERN.search(args)
+        start = int(uid_range.group(1)) if uid_range else 1
+        with self.server.lock:
+            messages = list(self.server.messages)
+        matches = [
+            str(uid) for uid, (msg_subject, _) in enumerate(messages, start=1)
+            if uid >= start and (not subject or subject.group(1).lower() in msg_subject.lower())
+        ]
+        self.announce()
+        self.send("* SEARCH " + " ".join(matches) if matches else "* SEARCH")
+        self.send(f"{tag} OK SEARCH completed")
+
+    def do_FETCH(self, tag, args):
+        uid = int(args.split(" ", 1)[0])
+        with self.server.lock:
+            messages = list(self.server.messages)
+        if 1 <= uid <= len(messages):
+            raw = messages[uid - 1][1]
+            self.wfile.write(f"* {uid} FETCH (UID {uid} RFC822 {{{len(raw)}}}\r\n".encode() + raw + b")\r\n")
+        self.announce()
+        self.send(f"{tag} OK FETCH completed")
+
+    def do_IDLE(self, tag, args):
+        """Push "* n EXISTS" whenever add_message() is called, until the client sends DONE."""
+        self.send("+ idling")
+        while True:
+            with self.server.lock:
+                self.server.new_message.wait_for(lambda: len(self.server.messages) != self.reported, timeout=0.05)
+            self.announce()
+            readable, _, _ = select.select([self.request], [], [], 0)
+            if readable:
+                line = self.rfile.readline()
+                if not line or line.strip().upper() == b"DONE":
+                    self.send(f"{tag} OK IDLE terminated")
+                    return bool(line)
+
+    def do_LOGOUT(self, tag, args):
+        self.send("* BYE logging out")
+        self.send(f"{tag} OK LOGOUT completed")
+        return False
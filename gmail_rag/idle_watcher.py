@@ -0,0 +1,192 @@
+#This is the push-mode counterpart of scheduler.py: it keeps one IMAP connection in IDLE on the inbox and, as soon
+# as the server reports new mail (EXISTS), fetches only the UIDs newer than each job's checkpoint, stores the
+# attachments and queues them for extraction / indexing (work_queue.py) or indexes them inline. IDLE is re-issued before Gmail's ~29 minute timeout
+# and the connection is re-established with backoff if it drops.
+#
+# Run: python idle_watcher.py [--inline-index | --no-index] [--metrics-port 9108]
+
+import argparse
+import imaplib
+import logging
+import os
+import select
+import time
+
+import mail_ingest
+import scheduler
+from instrumentation import configure_logging, count, log_event, start_metrics_server, timed
+from job_lock import JobLock
+from s3_utils import make_s3_client
+
+IDLE_TIMEOUT_SECONDS = 25 * 60  # Gmail drops IDLE connections after ~29 minutes
+POLL_FALLBACK_SECONDS = 60  # used when the server does not advertise IDLE
+SKIPPED_RETRY_SECONDS = 10  # IDLE timeout while a job skipped by catch_up (scheduler run in progress) is pending
+RECONNECT_BASE_DELAY = 5.0
+RECONNECT_MAX_DELAY = 300.0
+
+
+def _read_lines(sock, buffer, deadline):
+    """Read complete response lines straight from the socket until deadline; [] on timeout.
+
+    imaplib's buffered file object cannot be used with socket timeouts, so IDLE responses are read here.
+    """
+    while b"\r\n" not in buffer:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return []
+        # SSL sockets can hold decrypted bytes that select() does not see
+        if not (hasattr(sock, "pending") and sock.pending()):
+            readable, _, _ = select.select([sock], [], [], remaining)
+            if not readable:
+                return []
+        data = sock.recv(4096)
+        if not data:
+            raise imaplib.IMAP4.abort("connection closed during IDLE")
+        buffer.extend(data)
+    *lines, rest = bytes(buffer).split(b"\r\n")
+    buffer[:] = rest
+    return lines
+
+
+def _has_exists(lines):
+    return any(line.startswith(b"*") and line.endswith(b"EXISTS") for line in lines)
+
+
+def idle_wait(mail, timeout=IDLE_TIMEOUT_SECONDS):
+    """Send IDLE and block until the server reports new messages or timeout passes. Returns True on EXISTS."""
+    tag = mail._new_tag()
+    mail.send(tag + b" IDLE\r\n")
+    buffer = bytearray()
+    new_mail = False
+    deadline = time.monotonic() + 30
+    while True:
+        lines = _read_lines(mail.sock, buffer, deadline)
+        if not lines:
+            raise imaplib.IMAP4.abort("no IDLE continuation from server")
+        # Mail that arrived just before IDLE can be announced ahead of the continuation
+        new_mail = new_mail or _has_exists(lines)
+        if any(line.startswith(b"+") for line in lines):
+            break
+        if any(line.startswith(tag + b" ") for line in lines):
+            raise imaplib.IMAP4.error(f"IDLE rejected: {lines}")
+
+    deadline = time.monotonic() + timeout
+    while not new_mail:
+        lines = _read_lines(mail.sock, buffer, deadline)
+        if not lines:
+            break  # timeout: re-issue IDLE to keep the connection alive
+        new_mail = _has_exists(lines)
+
+    mail.send(b"DONE\r\n")
+    deadline = time.monotonic() + 30
+    while True:
+        lines = _read_lines(mail.sock, buffer, deadline)
+        if not lines:
+            raise imaplib.IMAP4.abort("no response to IDLE DONE")
+        new_mail = new_mail or _has_exists(lines)
+        if any(line.startswith(tag + b" ") for line in lines):
+            mail.tagged_commands.pop(tag, None)
+            return new_mail
+
+
+def catch_up(mail, handler, uidvalidity):
+    """Run every job against the open connection and return the jobs skipped because scheduler.py was running them.
+
+    The scheduler run may have searched before the new mail arrived, so the caller retries skipped jobs soon.
+    """
+    skipped = set()
+    for job_name in scheduler.JOBS:
+        lock = JobLock(f"scheduler_{job_name}")
+        if not lock.acquire():
+            log_event("catch_up_skipped", job=job_name, reason="scheduler run in progress")
+            skipped.add(job_name)
+            continue
+        try:
+            with timed("idle_catch_up", job=job_name):
+                scheduler.process_new_messages(mail, job_name, handler, uidvalidity)
+        finally:
+            lock.release()
+    return skipped
+
+
+def watch(credentials, handler, idle_timeout=IDLE_TIMEOUT_SECONDS):
+    """Connect, catch up, then IDLE forever; reconnects with exponential backoff on any connection error."""
+    failures = 0
+    while True:
+        mail = None
+        try:
+            mail = mail_ingest.connect_imap(*credentials)
+            uidvalidity = mail_ingest.get_uidvalidity(mail)
+            supports_idle = "IDLE" in mail.capabilities
+            log_event("watcher_connected", idle=supports_idle)
+            failures = 0
+            skipped = catch_up(mail, handler, uidvalidity)
+            while True:
+                # EXISTS sent while catch_up's SEARCH / FETCH ran was buffered by imaplib, not seen by IDLE
+                if mail.untagged_responses.pop("EXISTS", None):
+                    new_mail = True
+                elif supports_idle:
+                    new_mail = idle_wait(mail, SKIPPED_RETRY_SECONDS if skipped else idle_timeout)
+                else:
+                    time.sleep(SKIPPED_RETRY_SECONDS if skipped else POLL_FALLBACK_SECONDS)
+                    mail.noop()
+                    new_mail = True
+                if new_mail:
+                    count("idle_notifications_total")
+                # Also after a timeout: a missed notification then costs one IDLE cycle, and a catch up with
+                # nothing new is a single SEARCH per job
+                skipped = catch_up(mail, handler, uidvalidity)
+        except (imaplib.IMAP4.abort, imaplib.IMAP4.error, OSError) as e:
+            failures += 1
+            delay = min(RECONNECT_MAX_DELAY, RECONNECT_BASE_DELAY * 2 ** (failures - 1))
+            count("watcher_reconnects_total")
+            log_event("watcher_disconnected", level=logging.WARNING, error=repr(e), retry_in=delay)
+            if mail is not None:
+                try:
+                    mail.logout()
+                except Exception:
+                    pass
+            time.sleep(delay)
+
+
+def make_index_handler(s3_client, embeddings):
+    """Store each attachment like the scheduler does, then add it to the corpus index."""
+    from indexer import index_file
+
+    def handler(job_name, uid, filename, payload):
+        job = scheduler.JOBS[job_name]
+        scheduler.store_attachment(job, filename, payload, s3_client)
+        if job.get("index", True):
+            index_file(job_name, os.path.join(job["save_directory"], filename), embeddings)
+
+    return handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="IMAP IDLE watcher for near-real-time ingestion")
+    parser.add_argument("--no-index", action="store_true", help="only store attachments, skip indexing")
+    parser.add_argument("--inline-index", action="store_true",
+                        help="extract and index in this process instead of queueing for work_queue.py workers")
+    parser.add_argument("--queue", default=None, help="work queue database (default: work_queue.QUEUE_PATH)")
+    parser.add_argument("--metrics-port", type=int, default=None)
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    if args.no_index:
+        handler = scheduler.make_s3_handler()
+    else:
+        import streamlit as st
+        s3_client = make_s3_client(st.secrets["AWS_ACCESS_KEY"], st.secrets["AWS_SECRET_KEY"])
+        if args.inline_index:
+            from indexer import get_embeddings
+            handler = make_index_handler(s3_client, get_embeddings())
+        else:
+            from work_queue import QUEUE_PATH, WorkQueue, make_queue_handler
+            handler = make_queue_handler(WorkQueue(args.queue or QUEUE_PATH), s3_client)
+    watch(scheduler.load_credentials(), handler)
+
+
+if __name__ == "__main__":
+    main()
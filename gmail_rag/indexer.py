@@ -0,0 +1,105 @@
+#This module adds newly arrived documents to the existing per-corpus indexes (FAISS or pgvector, see
+# vector_backends.py) instead of rebuilding them,
+# so a freshly ingested PO dump or proforma invoice becomes searchable right away.
+
+import os
+
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+from extractors import extract_text, split_text
+from instrumentation import count, log_event, timed
+from job_lock import JobLock
+from query_service import CORPUS_INDEX_PATHS, EMBEDDING_MODEL
+from vector_backends import chunk_id, get_backend
+
+
+def get_embeddings():
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+
+def add_texts(corpus, texts, metadatas, embeddings):
+    """Embed chunks and append them to the corpus index."""
+    if not texts:
+        return 0
+    with timed("embedding", kind="documents", corpus=corpus):
+        vectors = embeddings.embed_documents(texts)
+    return add_embeddings(corpus, list(zip(texts, vectors)), metadatas, None, embeddings)
+
+
+def add_embeddings(corpus, text_embeddings, metadatas, ids, embeddings):
+    """Append (text, vector) pairs to the corpus index (creating it if needed) under a file lock.
+
+    When ids are given, ids already present in the index are skipped, so re-running the same batch is a no-op.
+    """
+    if not text_embeddings:
+        return 0
+    backend = get_backend(corpus, embeddings, index_path=CORPUS_INDEX_PATHS[corpus])
+    lock = JobLock(f"index_{corpus}")
+    lock.acquire(blocking=True)
+    try:
+        with timed("indexing", corpus=corpus, backend=backend.name):
+            added = backend.add_embeddings(text_embeddings, metadatas, ids)
+    finally:
+        lock.release()
+    count("indexed_chunks_total", added, corpus=corpus)
+    return added
+
+
+def replace_source(corpus, source, texts, embeddings):
+    """Make the corpus index hold exactly these chunks for one attachment (by file name) under the corpus lock.
+
+    Chunks of an earlier version of the file are deleted and only chunks not stored yet are embedded, so
+    re-indexing an unchanged file costs one id lookup. Returns the number of chunks added.
+    """
+    backend = get_backend(corpus, embeddings, index_path=CORPUS_INDEX_PATHS[corpus])
+    metadatas = [{"source": source} for _ in texts]
+    lock = JobLock(f"index_{corpus}")
+    lock.acquire(blocking=True)
+    try:
+        with timed("indexing", corpus=corpus, backend=backend.name):
+            stale = backend.source_ids(source) - {chunk_id(text, metadata) for text, metadata in zip(texts, metadatas)}
+            deleted = backend.delete(stale)
+            added = backend.add_texts(texts, metadatas)
+    finally:
+        lock.release()
+    if deleted:
+        log_event("document_replaced", corpus=corpus, source=source, deleted=deleted)
+    count("indexed_chunks_total", added, corpus=corpus)
+    return added
+
+
+def replace_sources(corpus, documents, embeddings):
+    """replace_source for chunks that are already embedded, for several attachments with one index rewrite.
+
+    documents maps a file name to its [(text, vector)] chunks; ids are the same content hashes replace_source
+    uses, so both paths agree on what a source holds. Returns the number of chunks added.
+    """
+    backend = get_backend(corpus, embeddings, index_path=CORPUS_INDEX_PATHS[corpus])
+    chunks = {}
+    for source, text_embeddings in documents.items():
+        for text, vector in text_embeddings:
+            metadata = {"source": source}
+            chunks.setdefault(chunk_id(text, metadata), (text, vector, metadata))
+    lock = JobLock(f"index_{corpus}")
+    lock.acquire(blocking=True)
+    try:
+        with timed("indexing", corpus=corpus, backend=backend.name):
+            stale = set().union(*(backend.source_ids(source) for source in documents)) - set(chunks)
+            deleted = backend.delete(stale)
+            added = backend.add_embeddings([(text, vector) for text, vector, _ in chunks.values()],
+                                           [metadata for _, _, metadata in chunks.values()], list(chunks))
+    finally:
+        lock.release()
+    if deleted:
+        log_event("document_replaced", corpus=corpus, sources=len(documents), deleted=deleted)
+    count("indexed_chunks_total", added, corpus=corpus)
+    return added
+
+
+def index_file(corpus, path, embeddings):
+    """Extract, chunk and index one downloaded attachment."""
+    chunks = split_text(extract_text(path))
+    source = os.path.basename(path)
+    added = replace_source(corpus, source, chunks, embeddings)
+    log_event("document_indexed", corpus=corpus, source=source, chunks=added)
+    return added
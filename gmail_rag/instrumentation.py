@@ -0,0 +1,210 @@
+#This module is a small in-process instrumentation layer: counters and latency histograms per pipeline stage
+# (IMAP, attachment decode, S3, extraction, embedding, FAISS search, LLM generation), structured JSON logs,
+# a Prometheus text endpoint and an optional cProfile hook for a single run.
+#
+# Usage:
+#     with timed("s3_upload", corpus="po"):
+#         s3_client.upload_file(...)
+#     start_metrics_server(9108)          # GET /metrics
+#     KALIKA_PROFILE=run.prof python scheduler.py --once
+
+import cProfile
+import contextlib
+import functools
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+METRIC_PREFIX = "kalika"
+# Latency buckets in seconds: from FAISS lookups (ms) up to full LLM answers / large PDF parses (minutes)
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+logger = logging.getLogger(METRIC_PREFIX)
+
+_lock = threading.Lock()
+_counters = {}    # (name, labels) -> value
+_histograms = {}  # (name, labels) -> {"buckets": [...], "sum": float, "count": int}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per log line; extra fields passed via log_event are included."""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", {}))
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=logging.INFO):
+    """Send the kalika logger to stderr as structured JSON (idempotent)."""
+    if not any(isinstance(h.formatter, JsonFormatter) for h in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+    logger.setLevel(level)
+    logger.propagate = False
+
+
+def log_event(event, level=logging.INFO, exc_info=False, **fields):
+    logger.log(level, event, exc_info=exc_info, extra={"fields": fields})
+
+
+def _key(name, labels):
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def count(name, value=1, **labels):
+    """Increment a counter."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram."""
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = {"buckets": [0] * len(LATENCY_BUCKETS), "sum": 0.0, "count": 0}
+        for i, bound in enumerate(LATENCY_BUCKETS):
+            if value <= bound:
+                histogram["buckets"][i] += 1
+        histogram["sum"] += value
+        histogram["count"] += 1
+
+
+@contextlib.contextmanager
+def timed(stage, **labels):
+    """Time a stage: records <prefix>_stage_seconds and <prefix>_stage_total{status=ok|error}.
+
+    Failures are logged with their traceback and duration, then re-raised.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception as e:
+        seconds = time.perf_counter() - start
+        observe("stage_seconds", seconds, stage=stage, **labels)
+        count("stage_total", stage=stage, status="error", **labels)
+        log_event("stage_failed", level=logging.ERROR, exc_info=True, stage=stage,
+                  seconds=round(seconds, 6), error=repr(e), **labels)
+        raise
+    seconds = time.perf_counter() - start
+    observe("stage_seconds", seconds, stage=stage, **labels)
+    count("stage_total", stage=stage, status="ok", **labels)
+    log_event("stage", level=logging.DEBUG, stage=stage, seconds=round(seconds, 6), **labels)
+
+
+def timed_function(stage, **labels):
+    """Decorator form of timed()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(stage, **labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def snapshot():
+    """Plain-dict copy of all metrics (for JSON reports)."""
+    with _lock:
+        counters = [{"name": n, "labels": dict(l), "value": v} for (n, l), v in _counters.items()]
+        histograms = [
+            {"name": n, "labels": dict(l), "count": h["count"], "sum": round(h["sum"], 6)}
+            for (n, l), h in _histograms.items()
+        ]
+    return {"counters": counters, "histograms": histograms}
+
+
+def reset():
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+def render_prometheus():
+    """Prometheus text exposition format."""
+    lines = []
+    with _lock:
+        counters = sorted(_counters.items())
+        histograms = sorted((k, dict(h, buckets=list(h["buckets"]))) for k, h in _histograms.items())
+    seen = set()
+    for (name, labels), value in counters:
+        metric = f"{METRIC_PREFIX}_{name}"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        lines.append(f"{metric}{_format_labels(labels)} {value}")
+    for (name, labels), histogram in histograms:
+        metric = f"{METRIC_PREFIX}_{name}"
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} histogram")
+            seen.add(metric)
+        for bound, bucket_count in zip(LATENCY_BUCKETS, histogram["buckets"]):
+            lines.append(f"{metric}_bucket{_format_labels(labels, [('le', bound)])} {bucket_count}")
+        lines.append(f"{metric}_bucket{_format_labels(labels, [('le', '+Inf')])} {histogram['count']}")
+        lines.append(f"{metric}_sum{_format_labels(labels)} {histogram['sum']}")
+        lines.append(f"{metric}_count{_format_labels(labels)} {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_error(404)
+            return
+        body = render_prometheus().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def start_metrics_server(port=9108, host="0.0.0.0"):
+    """Serve /metrics from a background thread; returns the server."""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log_event("metrics_server_started", port=port)
+    return server
+
+
+def profile_run(func, *args, output=None, top=25, **kwargs):
+    """Run func under cProfile, print the top functions by cumulative time and optionally dump stats.
+
+    output defaults to the KALIKA_PROFILE environment variable; open the dump with snakeviz or pstats.
+    """
+    output = output or os.environ.get("KALIKA_PROFILE")
+    profiler = cProfile.Profile()
+    try:
+        return profiler.runcall(func, *args, **kwargs)
+    finally:
+        stats = pstats.Stats(profiler).sort_stats("cumulative")
+        stats.print_stats(top)
+        if output:
+            stats.dump_stats(output)
+            log_event("profile_written", path=output)
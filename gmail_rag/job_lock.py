@@ -0,0 +1,34 @@
+#This module holds the per-job file lock shared by the scheduler, the IDLE watcher, the indexer and reconcile.py.
+# It only needs the standard library, so those modules can take a lock without importing scheduler.py
+# (and with it schedule and streamlit).
+
+import fcntl
+import os
+
+LOCK_DIRECTORY = "."  # lock files (.<name>.lock) live next to the scheduler checkpoints
+
+
+class JobLock:
+    """Non-blocking exclusive flock; acquire() returns False when another run holds it."""
+
+    def __init__(self, name, directory=LOCK_DIRECTORY):
+        self.path = os.path.join(directory, f".{name}.lock")
+        self.handle = None
+
+    def acquire(self, blocking=False):
+        self.handle = open(self.path, "w")
+        try:
+            fcntl.flock(self.handle, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.handle.close()
+            self.handle = None
+            return False
+        self.handle.write(str(os.getpid()))
+        self.handle.flush()
+        return True
+
+    def release(self):
+        if self.handle:
+            fcntl.flock(self.handle, fcntl.LOCK_UN)
+            self.handle.close()
+            self.handle = None
@@ -0,0 +1,133 @@
+#This module holds the IMAP side of ingestion shared by the store scripts, the scheduler and the benchmarks:
+# connecting, searching by subject rule, fetching messages by UID and decoding their attachments.
+
+import email
+import imaplib
+import logging
+from email.header import decode_header
+from instrumentation import count, log_event, timed
+
+IMAP_SERVER = "imap.gmail.com"
+MAX_EMAILS = 10  # same "last 10 emails" window the store scripts use
+
+
+def clean_filename(filename):
+    """Sanitize filename to prevent path traversal issues."""
+    return "".join(c if c.isalnum() or c in (".", "_") else "_" for c in filename)
+
+
+def clean_proforma_filename(filename):
+    """Remove unwanted characters from filename (proforma_s3store.py's rule, so stored names stay the same)."""
+    return "".join(c for c in filename if c.isalnum() or c in (".", "_", "-")).strip()
+
+
+# Subject keyword, attachment types and filename cleaner for each document type
+PO_RULE = {"name": "po", "subject": "PO Order", "extensions": (".xlsx",), "clean": clean_filename}
+PROFORMA_RULE = {"name": "proforma", "subject": "Proforma Invoice", "extensions": (".pdf",),
+                 "clean": clean_proforma_filename}
+SALE_BILLS_RULE = {"name": "sales", "subject": "Sale Bills", "extensions": (".xlsx", ".xls"), "clean": clean_filename}
+
+
+def connect_imap(account, password, server=IMAP_SERVER, port=None, ssl=True):
+    """Log in and select the inbox."""
+    if ssl:
+        mail = imaplib.IMAP4_SSL(server, port or imaplib.IMAP4_SSL_PORT)
+    else:
+        mail = imaplib.IMAP4(server, port or imaplib.IMAP4_PORT)
+    with timed("imap_login"):
+        mail.login(account, password)
+        mail.select("inbox")
+    return mail
+
+
+def get_uidvalidity(mail):
+    """UIDVALIDITY of the selected mailbox; UIDs from an older value must not be reused."""
+    _, data = mail.response("UIDVALIDITY")
+    if data and data[0]:
+        return int(data[-1])
+    _, data = mail.status("inbox", "(UIDVALIDITY)")
+    return int(data[0].split(b"UIDVALIDITY")[1].strip(b" ()"))
+
+
+def search_uids(mail, rule, since_uid=None, limit=MAX_EMAILS):
+    """Return UIDs (as bytes) of messages matching the rule's subject, oldest first.
+
+    With since_uid only messages newer than that UID are returned; limit keeps the newest N (None = all).
+    """
+    criteria = f'(SUBJECT "{rule["subject"]}")'
+    if since_uid:
+        criteria = f'(UID {int(since_uid) + 1}:* SUBJECT "{rule["subject"]}")'
+    with timed("imap_search", corpus=rule["name"]):
+        status, data = mail.uid("search", None, criteria)
+    if status != "OK" or not data or not data[0]:
+        return []
+    uids = data[0].split()
+    if since_uid:
+        # "n:*" always matches the newest message, even when its UID is below n
+        uids = [uid for uid in uids if int(uid) > int(since_uid)]
+    return uids[-limit:] if limit else uids
+
+
+def fetch_message(mail, uid):
+    """Fetch one full message by UID."""
+    with timed("imap_fetch"):
+        status, msg_data = mail.uid("fetch", uid, "(RFC822)")
+    if status != "OK":
+        raise imaplib.IMAP4.error(f"FETCH {uid!r} failed: {status}")
+    for response_part in msg_data:
+        if isinstance(response_part, tuple):
+            return email.message_from_bytes(response_part[1])
+    raise imaplib.IMAP4.error(f"FETCH {uid!r} returned no message body")
+
+
+def decode_filename(filename):
+    """Decode RFC 2047 encoded attachment names."""
+    decoded, charset = decode_header(filename)[0]
+    if isinstance(decoded, bytes):
+        decoded = decoded.decode(charset or "utf-8", errors="replace")
+    return decoded
+
+
+def iter_attachments(msg, rule, clean=None):
+    """Yield (cleaned filename, payload bytes) for attachments with one of the rule's extensions.
+
+    Names go through the rule's cleaner unless clean overrides it (the Streamlit apps keep their own).
+    """
+    extensions, clean = rule["extensions"], clean or rule["clean"]
+    for part in msg.walk():
+        if part.get_content_disposition() != "attachment":
+            continue
+        filename = part.get_filename()
+        if not filename:
+            continue
+        filename = decode_filename(filename)
+        if filename.lower().endswith(extensions):
+            with timed("attachment_decode"):
+                payload = part.get_payload(decode=True)
+            count("attachment_bytes", len(payload or b""))
+            yield clean(filename), payload
+
+
+def fetch_attachments(mail, rule, uids):
+    """Yield (uid, filename, payload) for every matching attachment in the given messages."""
+    for uid in uids:
+        msg = fetch_message(mail, uid)
+        for filename, payload in iter_attachments(msg, rule):
+            yield uid, filename, payload
+
+
+def download_attachments(mail, rule, save, clean=None):
+    """Pass each matching attachment of the last MAX_EMAILS messages to save(filename, payload).
+
+    A bad message is logged and counted instead of aborting the rest of the batch.
+    """
+    for uid in search_uids(mail, rule):
+        try:
+            msg = fetch_message(mail, uid)
+            for filename, payload in iter_attachments(msg, rule, clean):
+                save(filename, payload)
+            count("messages_processed_total", corpus=rule["name"], status="ok")
+        except Exception as e:
+            count("messages_processed_total", corpus=rule["name"], status="error")
+            log_event("message_failed", level=logging.ERROR, exc_info=True,
+                      corpus=rule["name"], uid=uid.decode(), error=repr(e))
@@ -0,0 +1,102 @@
+#This module is a stand-in for the Ollama server's /api/generate endpoint. It streams a fixed number of fake
+# tokens with configurable delays so the RAG apps, rag_api and the benchmarks can be exercised without a model.
+#
+# Run: python ollama_stub.py --port 11435 --tokens 64 --first-token-delay 0.2 --token-delay 0.02
+
+import argparse
+import json
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+DEFAULT_PORT = 11435
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    tokens = 64
+    first_token_delay = 0.2
+    token_delay = 0.02
+
+    def log_message(self, format, *args):
+        pass  # keep load tests quiet
+
+    def _send_json(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/api/tags":
+            self._send_json({"models": [{"name": "llama2:latest"}]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/api/generate":
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        model = request.get("model", "llama2:latest")
+        prompt_tokens = len(request.get("prompt", "")) // 4
+        words = [f"token{i} " for i in range(self.tokens)]
+
+        time.sleep(self.first_token_delay)
+        if not request.get("stream", True):
+            time.sleep(self.token_delay * self.tokens)
+            self._send_json(self._chunk(model, "".join(words), True, prompt_tokens))
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        for word in words:
+            self.wfile.write((json.dumps(self._chunk(model, word, False, prompt_tokens)) + "\n").encode())
+            self.wfile.flush()
+            time.sleep(self.token_delay)
+        self.wfile.write((json.dumps(self._chunk(model, "", True, prompt_tokens)) + "\n").encode())
+        self.wfile.flush()
+
+    def _chunk(self, model, text, done, prompt_tokens):
+        chunk = {
+            "model": model,
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "response": text,
+            "done": done,
+        }
+        if done:
+            chunk.update({"prompt_eval_count": prompt_tokens, "eval_count": self.tokens})
+        return chunk
+
+
+def start_stub(port=DEFAULT_PORT, tokens=64, first_token_delay=0.2, token_delay=0.02):
+    """Start the stub in a background thread and return the server (call .shutdown() to stop)."""
+    handler = type("ConfiguredOllamaStub", (OllamaStubHandler,), {
+        "tokens": tokens,
+        "first_token_delay": first_token_delay,
+        "token_delay": token_delay,
+    })
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Ollama server for load tests")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--tokens", type=int, default=64)
+    parser.add_argument("--first-token-delay", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    args = parser.parse_args()
+
+    stub = start_stub(args.port, args.tokens, args.first_token_delay, args.token_delay)
+    print(f"Ollama stub listening on http://127.0.0.1:{args.port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stub.shutdown()
@@ -0,0 +1,298 @@
+#This script benchmarks the whole Gmail RAG pipeline without Gmail, AWS or Ollama: a local fake IMAP server is
+# seeded with synthetic PO / proforma mails, S3 is mocked with moto (or a MinIO endpoint), and ollama_stub.py
+# stands in for the LLM. Each stage is timed and the results are written as JSON so runs can be compared.
+#
+# Run: python pipeline_bench.py --po-mails 20 --po-rows 500 --proforma-mails 20 --proforma-lines 40 --fake-embeddings
+#      add --backends faiss,pgvector-hnsw,pgvector-ivfflat --pg-dsn ... to compare vector store ingestion / search
+
+import argparse
+import contextlib
+import glob
+import hashlib
+import json
+import os
+import platform
+import statistics
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+import mail_ingest
+from chunk_store import build_vector_store
+import synthetic_docs
+from extractors import extract_text, split_text
+from fake_imap import FakeImapServer
+from instrumentation import profile_run, snapshot
+from ollama_stub import start_stub
+from rag_stream import TOP_K, get_llm, stream_rag_answer
+from s3_utils import make_s3_client, upload_to_s3
+from vector_backends import PGVECTOR_DSN, FaissBackend, PgvectorBackend
+
+RESULTS_DIRECTORY = "bench_results"
+BENCH_BUCKET = "kalika-rag-bench"
+EMBED_BATCH_SIZE = 64
+
+BENCH_QUERIES = [
+    "Which PO orders are still pending?",
+    "What is the total on proforma invoice PI-000003?",
+    "Has PO 4500000004 been invoiced?",
+    "List orders for Cummins India Limited",
+]
+
+
+class HashEmbeddings(Embeddings):
+    """Deterministic feature-hashing embedder, to time the pipeline without downloading a model."""
+
+    def __init__(self, dim=384):
+        self.dim = dim
+
+    def _embed(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            bucket = int.from_bytes(hashlib.blake2b(word.encode(), digest_size=4).digest(), "little")
+            vector[bucket % self.dim] += 1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@contextlib.contextmanager
+def stage(results, name, items=None):
+    """Time a pipeline stage; items may be updated inside the block via the yielded dict."""
+    record = {"items": items}
+    start = time.perf_counter()
+    yield record
+    seconds = time.perf_counter() - start
+    record["seconds"] = round(seconds, 6)
+    if record["items"]:
+        record["items_per_second"] = round(record["items"] / seconds, 3) if seconds else None
+    results["stages"][name] = record
+    print(f"{name:<16} {seconds:8.3f}s  items={record['items']}")
+
+
+@contextlib.contextmanager
+def mocked_s3(endpoint_url):
+    """Yield an S3 client backed by MinIO (endpoint_url) or by moto's in-memory mock."""
+    if endpoint_url:
+        yield make_s3_client(
+            os.environ.get("AWS_ACCESS_KEY_ID", "minioadmin"),
+            os.environ.get("AWS_SECRET_ACCESS_KEY", "minioadmin"),
+            endpoint_url,
+        )
+        return
+    try:
+        from moto import mock_aws
+    except ImportError:  # moto < 5
+        from moto import mock_s3 as mock_aws
+    os.environ.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    with mock_aws():
+        yield make_s3_client("testing", "testing")
+
+
+def get_embeddings(fake):
+    if fake:
+        return HashEmbeddings()
+    from query_service import EMBEDDING_MODEL
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+
+def run_benchmark(args):
+    results = {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "host": platform.node(),
+        "python": platform.python_version(),
+        "config": vars(args),
+        "stages": {},
+    }
+    workdir = tempfile.mkdtemp(prefix="kalika_bench_")
+
+    imap_server = FakeImapServer().start()
+    with stage(results, "seed_mailbox", args.po_mails + args.proforma_mails) as record:
+        record["bytes"] = synthetic_docs.seed_mailbox(
+            imap_server, args.po_mails, args.po_rows, args.proforma_mails, args.proforma_lines, args.seed)
+    llm_stub = start_stub(args.ollama_port, args.stub_tokens, args.stub_first_token_delay, args.stub_token_delay)
+
+    rules = [mail_ingest.PO_RULE, mail_ingest.PROFORMA_RULE]
+    mail = mail_ingest.connect_imap("bench", "bench", "127.0.0.1", imap_server.port, ssl=False)
+    with stage(results, "imap_search") as record:
+        uids = {rule["name"]: mail_ingest.search_uids(mail, rule, limit=None) for rule in rules}
+        record["items"] = sum(len(found) for found in uids.values())
+
+    files = []
+    with stage(results, "imap_fetch") as record:
+        for rule in rules:
+            for uid, filename, payload in mail_ingest.fetch_attachments(mail, rule, uids[rule["name"]]):
+                path = os.path.join(workdir, filename)
+                with open(path, "wb") as f:
+                    f.write(payload)
+                files.append((rule["name"], path))
+        record["items"] = len(files)
+        record["bytes"] = sum(os.path.getsize(path) for _, path in files)
+    mail.logout()
+
+    with mocked_s3(args.s3_endpoint) as s3_client:
+        s3_client.create_bucket(Bucket=BENCH_BUCKET)
+        with stage(results, "s3_upload", len(files)):
+            for name, path in files:
+                upload_to_s3(s3_client, path, BENCH_BUCKET, f"{name}/{os.path.basename(path)}")
+
+    texts = []
+    metadatas = []
+    for name, extension in (("extract_excel", ".xlsx"), ("extract_pdf", ".pdf")):
+        paths = [(corpus, path) for corpus, path in files if path.endswith(extension)]
+        with stage(results, name, len(paths)) as record:
+            chunks = []
+            for corpus, path in paths:
+                path_chunks = split_text(extract_text(path))
+                chunks.extend(path_chunks)
+                metadatas.extend({"corpus": corpus, "source": os.path.basename(path)} for _ in path_chunks)
+            record["chunks"] = len(chunks)
+        texts.extend(chunks)
+
+    embeddings = get_embeddings(args.fake_embeddings)
+    with stage(results, "embedding", len(texts)):
+        vectors = []
+        for i in range(0, len(texts), EMBED_BATCH_SIZE):
+            vectors.extend(embeddings.embed_documents(texts[i:i + EMBED_BATCH_SIZE]))
+
+    with stage(results, "indexing", len(texts)):
+        vector_store = build_vector_store(os.path.join(workdir, "faiss_index"), list(zip(texts, vectors)), embeddings)
+
+    if args.backends:
+        results["backends"] = compare_backends(results, args, texts, vectors, metadatas, embeddings, workdir)
+
+    llm = get_llm(base_url=f"http://127.0.0.1:{args.ollama_port}")
+    query_metrics = []
+    with stage(results, "query", args.queries):
+        for i in range(args.queries):
+            for kind, value in stream_rag_answer(vector_store, BENCH_QUERIES[i % len(BENCH_QUERIES)], llm=llm):
+                if kind == "metrics":
+                    query_metrics.append(value)
+    results["query"] = summarize_queries(query_metrics)
+    results["metrics"] = snapshot()
+
+    llm_stub.shutdown()
+    imap_server.shutdown()
+    return results
+
+
+def make_bench_backend(name, embeddings, workdir, dsn):
+    if name == "faiss":
+        return FaissBackend(os.path.join(workdir, "backend_faiss"), embeddings)
+    if name.startswith("pgvector-"):
+        index_type = name.split("-", 1)[1]
+        backend = PgvectorBackend(f"bench_{index_type}", embeddings, dsn=dsn, index_type=index_type)
+        backend.drop()
+        return backend
+    raise ValueError(f"Unknown backend {name}, expected faiss, pgvector-hnsw or pgvector-ivfflat")
+
+
+def compare_backends(results, args, texts, vectors, metadatas, embeddings, workdir):
+    """Bulk ingestion and search latency (plain and metadata-filtered) per backend, plus recall against FAISS."""
+    query_vectors = embeddings.embed_documents(BENCH_QUERIES)
+    ids = [f"bench:{i}" for i in range(len(texts))]
+    comparison = {}
+    exact_hits = {}
+    for name in args.backends:
+        backend = make_bench_backend(name, embeddings, workdir, args.pg_dsn)
+        with stage(results, f"ingest_{name}", len(texts)):
+            backend.add_embeddings(list(zip(texts, vectors)), metadatas, ids)
+        comparison[name] = {}
+        for label, search_filter in (("search", None), ("filtered_search", {"corpus": "proforma"})):
+            timings = []
+            hits = {}
+            with stage(results, f"{label}_{name}", args.searches):
+                for i in range(args.searches):
+                    query = i % len(query_vectors)
+                    start = time.perf_counter()
+                    found = backend.search_by_vector(query_vectors[query], k=TOP_K, filter=search_filter)
+                    timings.append(time.perf_counter() - start)
+                    hits[query] = {doc.id for doc, _ in found}
+            comparison[name][label] = {
+                "p50": statistics.median(timings), "p95": percentile(timings, 0.95), "max": max(timings)}
+            if name == "faiss":
+                exact_hits[label] = hits
+            elif label in exact_hits:
+                # FAISS here is a flat (exact) index, so overlap with it is the ANN index's recall@k
+                overlaps = [len(hits[q] & exact) / len(exact) for q, exact in exact_hits[label].items() if exact]
+                comparison[name][label]["recall_vs_faiss"] = round(statistics.mean(overlaps), 4) if overlaps else None
+        print(f"{name:<16} " + "  ".join(f"{label} p50={values['p50'] * 1000:.2f}ms"
+                                         for label, values in comparison[name].items()))
+    return comparison
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize_queries(metrics):
+    summary = {}
+    for key in ("retrieval_seconds", "time_to_first_token", "total_seconds", "prompt_tokens", "tokens_per_second"):
+        values = [m[key] for m in metrics]
+        if values:
+            summary[key] = {"p50": statistics.median(values), "p95": percentile(values, 0.95), "max": max(values)}
+    return summary
+
+
+def compare_with_previous(results, directory):
+    """Print per-stage time changes against the most recent earlier result file."""
+    previous_files = sorted(glob.glob(os.path.join(directory, "pipeline_*.json")))
+    if not previous_files:
+        return
+    with open(previous_files[-1]) as f:
+        previous = json.load(f)
+    print(f"\nCompared with {os.path.basename(previous_files[-1])}:")
+    for name, record in results["stages"].items():
+        before = previous.get("stages", {}).get(name, {}).get("seconds")
+        if before:
+            change = (record["seconds"] - before) / before * 100
+            print(f"{name:<16} {before:8.3f}s -> {record['seconds']:8.3f}s ({change:+.1f}%)")
+
+
+def write_results(results, directory=RESULTS_DIRECTORY):
+    os.makedirs(directory, exist_ok=True)
+    compare_with_previous(results, directory)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = os.path.join(directory, f"pipeline_{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=2, default=str)
+    print(f"Results written to {path}")
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="End-to-end Gmail RAG pipeline benchmark")
+    parser.add_argument("--po-mails", type=int, default=10)
+    parser.add_argument("--po-rows", type=int, default=200, help="rows per PO dump workbook")
+    parser.add_argument("--proforma-mails", type=int, default=10)
+    parser.add_argument("--proforma-lines", type=int, default=20, help="line items per proforma PDF")
+    parser.add_argument("--queries", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--fake-embeddings", action="store_true", help="use a hashing embedder instead of MiniLM")
+    parser.add_argument("--s3-endpoint", default=None, help="MinIO / S3-compatible endpoint; moto is used if unset")
+    parser.add_argument("--ollama-port", type=int, default=11435)
+    parser.add_argument("--stub-tokens", type=int, default=64)
+    parser.add_argument("--stub-first-token-delay", type=float, default=0.05)
+    parser.add_argument("--stub-token-delay", type=float, default=0.0)
+    parser.add_argument("--backends", type=lambda value: value.split(","), default=[],
+                        help="vector backends to compare, e.g. faiss,pgvector-hnsw,pgvector-ivfflat (faiss first)")
+    parser.add_argument("--pg-dsn", default=PGVECTOR_DSN)
+    parser.add_argument("--searches", type=int, default=200, help="searches per backend in the comparison")
+    parser.add_argument("--output-dir", default=RESULTS_DIRECTORY)
+    parser.add_argument("--profile", default=None, help="write cProfile stats for the run to this file")
+    args = parser.parse_args()
+    if args.profile:
+        results = profile_run(run_benchmark, args, output=args.profile)
+    else:
+        results = run_benchmark(args)
+    write_results(results, args.output_dir)
@@ -1,6 +1,5 @@
 import imaplib
-import email
-from email.header import decode_header
+import logging
 import os
 import datetime
 import re
@@ -12,9 +11,11 @@ import pandas as pd
 from docx import Document
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain_community.llms import Ollama
-from langchain.chains import RetrievalQA
+from instrumentation import count, log_event, timed
+from mail_ingest import PROFORMA_RULE, connect_imap, download_attachments
+from indexer import replace_source
+from vector_backends import get_backend
+from rag_stream import answer_rag, write_streaming_answer
 
 # Email Configuration
 IMAP_SERVER = "imap.gmail.com"
@@ -35,45 +36,32 @@ EMAIL_PASSWORD = st.secrets["EMAIL_PASSWORD"]
 def clean_filename(filename):
     return re.sub(r'[\\/*?:"<>|]', "", filename).strip()[:100]
 
+def save_proforma_pdf(filename, payload):
+    filepath = os.path.join(SAVE_DIRECTORY, filename)
+    if not os.path.exists(filepath):
+        with open(filepath, "wb") as f:
+            f.write(payload)
+        st.write(f"Saved: {filepath}")
+    else:
+        st.write(f"File already exists: {filepath}, skipping download.")
+
 # Download Proforma Invoice PDFs
 def download_proforma_pdfs():
-    try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-        mail.login(EMAIL_ACCOUNT, EMAIL_PASSWORD)
-        mail.select("inbox")
-
-        status, email_ids = mail.search(None, '(SUBJECT "Proforma Invoice")')
-
-        if status == "OK":
-            email_ids = email_ids[0].split()[-10:]  # Get last 10 emails
-            os.makedirs(SAVE_DIRECTORY, exist_ok=True)
-
-            for e_id in email_ids:
-                status, msg_data = mail.fetch(e_id, "(RFC822)")
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        for part in msg.walk():
-                            if part.get_content_disposition() == "attachment":
-                                filename = part.get_filename()
-                                if filename and filename.lower().endswith(".pdf"):
-                                    filename = decode_header(filename)[0][0]
-                                    if isinstance(filename, bytes):
-                                        filename = filename.decode()
-
-                                    cleaned_filename = clean_filename(filename)
-                                    filepath = os.path.join(SAVE_DIRECTORY, cleaned_filename)
-
-                                    if not os.path.exists(filepath):
-                                        with open(filepath, "wb") as f:
-                                            f.write(part.get_payload(decode=True))
-                                        st.write(f"Saved: {filepath}")
-                                    else:
-                                        st.write(f"File already exists: {filepath}, skipping download.")
-        mail.logout()
-        print("Proforma Invoice PDFs downloaded successfully!")
-    except Exception as e:
-        print(f"Error: {e}")
+    os.makedirs(SAVE_DIRECTORY, exist_ok=True)
+    with timed("download_job", corpus="proforma"):
+        try:
+            mail = connect_imap(EMAIL_ACCOUNT, EMAIL_PASSWORD, IMAP_SERVER)
+        except (imaplib.IMAP4.error, OSError) as e:
+            # Gmail being unreachable should not stop the app answering from the files it already has
+            count("download_jobs_failed_total", corpus="proforma")
+            log_event("download_failed", level=logging.ERROR, exc_info=True, corpus="proforma", error=repr(e))
+            st.error(f"Could not fetch new proforma invoice emails: {e}")
+            return
+        try:
+            download_attachments(mail, PROFORMA_RULE, save_proforma_pdf, clean_filename)
+        finally:
+            mail.logout()
+    print("Proforma Invoice PDFs downloaded successfully!")
 
 # Extract Key Data from PDFs
 def extract_proforma_text(pdf_path):
@@ -83,7 +71,7 @@ def extract_proforma_text(pdf_path):
             text += page.extract_text() + "\n"
     return text
 
-# Process Proforma PDFs
+# Process Proforma PDFs: (filename, chunks) per invoice
 def process_proforma_documents():
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
     all_texts = []
@@ -92,9 +80,9 @@ def process_proforma_documents():
         filepath = os.path.join(SAVE_DIRECTORY, filename)
         if filename.endswith(".pdf"):
             text = extract_proforma_text(filepath)
-            all_texts.extend(text_splitter.split_text(text))
+            all_texts.append((filename, text_splitter.split_text(text)))
 
-    print(f"Extracted {len(all_texts)} text chunks from proforma invoices.")
+    print(f"Extracted {sum(len(chunks) for _, chunks in all_texts)} text chunks from proforma invoices.")
     return all_texts
 
 # Create FAISS Vector Store for Proforma PDFs
@@ -104,18 +92,20 @@ def create_proforma_vector_store(documents):
         return None
 
     embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vector_store = FAISS.from_texts(documents, embeddings)
-    vector_store.save_local(FAISS_INDEX_PATH)
-    return vector_store
+    # Through the indexer so the write takes the same lock as the watcher / work queue, replaces older
+    # versions of a re-downloaded invoice and only embeds what changed
+    for filename, chunks in documents:
+        replace_source("proforma", filename, chunks, embeddings)
+    return get_backend("proforma", embeddings, index_path=FAISS_INDEX_PATH)
 
 # Load or Create FAISS Index for Proforma Invoices
 @st.cache_resource
 def get_proforma_vector_store():
-    if os.path.exists(FAISS_INDEX_PATH):
-        st.info("Loading existing Proforma FAISS index...")
-        return FAISS.load_local(FAISS_INDEX_PATH,
-                                HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),
-                                allow_dangerous_deserialization=True)
+    vector_store = get_backend("proforma", HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2"),
+                               index_path=FAISS_INDEX_PATH)
+    if vector_store.available():
+        st.info(f"Loading existing Proforma index ({vector_store.name})...")
+        return vector_store
     
     documents = process_proforma_documents()
     return create_proforma_vector_store(documents)
@@ -126,11 +116,7 @@ def query_proforma_rag(query):
     if not vector_store:
         return "Index not found. Please build the index first."
 
-    retriever = vector_store.as_retriever()
-    llm = Ollama(model="llama2:latest")  # Using Llama2
-    chain = RetrievalQA.from_chain_type(llm, retriever=retriever)
-    
-    return chain.run(query)
+    return answer_rag(vector_store, query)["answer"]
 
 # Streamlit UI
 st.title("RAG System for Proforma Invoice Analysis")
@@ -141,5 +127,9 @@ create_proforma_vector_store(documents)
 
 query = st.text_input("Enter your query about Proforma Invoices:")
 if query:
-    answer = query_proforma_rag(query)
-    st.write("Answer:", answer)
+    vector_store = get_proforma_vector_store()
+    if not vector_store:
+        st.write("Answer:", "Index not found. Please build the index first.")
+    else:
+        # Stream tokens into the page as Llama2 produces them
+        write_streaming_answer(vector_store, query)
@@ -2,28 +2,27 @@
 #  and enables querying via Llama2 in a Streamlit RAG system.
 
 import imaplib
-import email
-from email.header import decode_header
+import logging
 import os
 import re
 import boto3
-import faiss
 import tempfile
 import numpy as np
 import streamlit as st
 import pdfplumber
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_huggingface import HuggingFaceEmbeddings  # Corrected Import
-from langchain_community.vectorstores import FAISS
-from langchain_community.llms import Ollama
-from langchain.chains import RetrievalQA
+from chunk_store import build_vector_store_from_texts, open_vector_store, vector_store_exists
+from instrumentation import count, log_event, timed
+from mail_ingest import PROFORMA_RULE, connect_imap, download_attachments
+from rag_stream import answer_rag, write_streaming_answer
 
 # Email Configuration
 IMAP_SERVER = "imap.gmail.com"
 SAVE_DIRECTORY = "proforma_pdfs"
 S3_BUCKET_NAME = "kalika-rag"
-FAISS_INDEX_PATH = "proforma_faiss_index.index"
-FAISS_INDEX_PATH_S3 = "s3://kalika-rag/faiss_indexes/"  
+FAISS_INDEX_PATH = os.path.join(tempfile.gettempdir(), "proforma_faiss_index")  # index.faiss + chunks.sqlite
+S3_FAISS_INDEX_PATH = "faiss_indexes/proforma_faiss_index"
 # Load credentials from Streamlit secrets
 from streamlit import secrets
 
@@ -43,41 +42,28 @@ s3_client = boto3.client(
 def clean_filename(filename):
     return re.sub(r'[\\/*?:"<>|]', "", filename).strip()[:100]
 
+def save_proforma_pdf(filename, payload):
+    filepath = os.path.join(SAVE_DIRECTORY, filename)
+    with open(filepath, "wb") as f:
+        f.write(payload)
+    print(f"Saved: {filepath}")
+
 # Download Proforma Invoice PDFs
 def download_proforma_pdfs():
-    try:
-        mail = imaplib.IMAP4_SSL(IMAP_SERVER)
-        mail.login(EMAIL_ACCOUNT, EMAIL_PASSWORD)
-        mail.select("inbox")
-
-        status, email_ids = mail.search(None, '(SUBJECT "Proforma Invoice")')
-
-        if status == "OK":
-            email_ids = email_ids[0].split()[-10:]  # Get last 10 emails
-            os.makedirs(SAVE_DIRECTORY, exist_ok=True)
-
-            for e_id in email_ids:
-                status, msg_data = mail.fetch(e_id, "(RFC822)")
-                for response_part in msg_data:
-                    if isinstance(response_part, tuple):
-                        msg = email.message_from_bytes(response_part[1])
-                        for part in msg.walk():
-                            if part.get_content_disposition() == "attachment":
-                                filename = part.get_filename()
-                                if filename and filename.lower().endswith(".pdf"):
-                                    filename = decode_header(filename)[0][0]
-                                    if isinstance(filename, bytes):
-                                        filename = filename.decode()
-
-                                    cleaned_filename = clean_filename(filename)
-                                    filepath = os.path.join(SAVE_DIRECTORY, cleaned_filename)
-
-                                    with open(filepath, "wb") as f:
-                                        f.write(part.get_payload(decode=True))
-                                        print(f"Saved: {filepath}")
-        mail.logout()
-    except Exception as e:
-        st.error(f"Error: {e}")
+    os.makedirs(SAVE_DIRECTORY, exist_ok=True)
+    with timed("download_job", corpus="proforma"):
+        try:
+            mail = connect_imap(EMAIL_ACCOUNT, EMAIL_PASSWORD, IMAP_SERVER)
+        except (imaplib.IMAP4.error, OSError) as e:
+            # Gmail being unreachable should not stop the app answering from the files it already has
+            count("download_jobs_failed_total", corpus="proforma")
+            log_event("download_failed", level=logging.ERROR, exc_info=True, corpus="proforma", error=repr(e))
+            st.error(f"Could not fetch new proforma invoice emails: {e}")
+            return
+        try:
+            download_attachments(mail, PROFORMA_RULE, save_proforma_pdf, clean_filename)
+        finally:
+            mail.logout()
 
 # Extract text from PDFs
 def extract_proforma_text(pdf_path):
@@ -100,20 +86,26 @@ def process_proforma_documents():
 
     return all_texts
 
-# Upload FAISS index to S3
+# Upload FAISS index and chunk store to S3
 def upload_faiss_to_s3():
-    if os.path.exists(FAISS_INDEX_PATH):
-        with open(FAISS_INDEX_PATH, "rb") as f:
-            s3_client.upload_fileobj(f, S3_BUCKET_NAME, FAISS_INDEX_PATH_S3)
-        st.success("FAISS index uploaded to S3 successfully.")
+    for file in os.listdir(FAISS_INDEX_PATH):
+        s3_key = f"{S3_FAISS_INDEX_PATH}/{file}"
+        s3_client.upload_file(os.path.join(FAISS_INDEX_PATH, file), S3_BUCKET_NAME, s3_key)
+        print(f"Uploaded FAISS index to S3: {s3_key}")
 
-# Download FAISS index from S3
+# Download FAISS index and chunk store from S3
 def download_faiss_from_s3():
+    os.makedirs(FAISS_INDEX_PATH, exist_ok=True)
     try:
-        s3_client.download_file(S3_BUCKET_NAME, FAISS_INDEX_PATH_S3, FAISS_INDEX_PATH)
-        return True
+        s3_paginator = s3_client.get_paginator("list_objects_v2")
+        for page in s3_paginator.paginate(Bucket=S3_BUCKET_NAME, Prefix=f"{S3_FAISS_INDEX_PATH}/"):
+            for obj in page.get("Contents", []):
+                s3_key = obj["Key"]
+                local_path = os.path.join(FAISS_INDEX_PATH, os.path.basename(s3_key))
+                s3_client.download_file(S3_BUCKET_NAME, s3_key, local_path)
     except Exception:
         return False
+    return vector_store_exists(FAISS_INDEX_PATH)
 
 # Create FAISS Vector Store
 def create_proforma_vector_store(documents):
@@ -122,19 +114,9 @@ def create_proforma_vector_store(documents):
         return None
 
     embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    vector_store = FAISS.from_texts(documents, embeddings)
-
-    global FAISS_INDEX_PATH  # Ensure we modify the global variable
-
-    try:
-        # Try writing FAISS index to the current directory
-        faiss.write_index(vector_store.index, FAISS_INDEX_PATH)
-    except RuntimeError:
-        # If permission is denied, use a temporary directory
-        temp_index_path = os.path.join(tempfile.gettempdir(), "faiss_index.index")
-        faiss.write_index(vector_store.index, temp_index_path)
-        FAISS_INDEX_PATH = temp_index_path  # Update the global path
-        st.warning(f"Permission denied for saving in the current directory. Using temp path: {FAISS_INDEX_PATH}")
+    # The chunk store keeps the text next to the vectors, so a reloaded index can still answer with it
+    vector_store = build_vector_store_from_texts(FAISS_INDEX_PATH, documents, embeddings)
+    upload_faiss_to_s3()
 
     return vector_store
 
@@ -145,8 +127,7 @@ def get_proforma_vector_store():
     
     if download_faiss_from_s3():
         st.info("Loaded FAISS index from S3.")
-        index = faiss.read_index(FAISS_INDEX_PATH)
-        return FAISS(index=index, embeddings=embeddings)
+        return open_vector_store(FAISS_INDEX_PATH, embeddings, read_only=True)
     
     # If S3 index is not available, process documents and create new index
     documents = process_proforma_documents()
@@ -158,11 +139,7 @@ def query_proforma_rag(query):
     if not vector_store:
         return "Index not found. Please build the index first."
 
-    retriever = vector_store.as_retriever()
-    llm = Ollama(model="llama2:latest")  # Using Llama2
-    chain = RetrievalQA.from_chain_type(llm, retriever=retriever)
-    
-    return chain.run(query)
+    return answer_rag(vector_store, query)["answer"]
 
 # Streamlit UI
 st.title("RAG System for Proforma Invoice Analysis")
@@ -175,5 +152,9 @@ create_proforma_vector_store(documents)
 # Query Input
 query = st.text_input("Enter your query about Proforma Invoices:")
 if query:
-    answer = query_proforma_rag(query)
-    st.write("Answer:", answer)
+    vector_store = get_proforma_vector_store()
+    if not vector_store:
+        st.write("Answer:", "Index not found. Please build the index first.")
+    else:
+        # Stream tokens into the page as Llama2 produces them
+        write_streaming_answer(vector_store, query)
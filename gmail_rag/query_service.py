@@ -0,0 +1,129 @@
+#This module holds the PO and proforma indexes (FAISS or pgvector) in one process with a single embedding model and Ollama client,
+# routes each query to the relevant corpus (or fans it out to all of them concurrently) and merges the hits,
+# so cross-document questions like "has PO 1234 been invoiced?" can be answered from one place.
+
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
+from langchain_community.embeddings import HuggingFaceEmbeddings
+from instrumentation import timed
+from rag_stream import TOP_K, get_llm, stream_rag_answer
+from vector_backends import get_backend
+
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+# FAISS index directories (index.faiss + chunks.sqlite) written by PO_rag.py / proforma_rag.py / indexer.py;
+# with VECTOR_BACKEND=pgvector the same corpus names map to Postgres tables instead
+CORPUS_INDEX_PATHS = {
+    "po": "po_faiss_index",
+    "proforma": "proforma_faiss_index",
+}
+
+REFRESH_INTERVAL_SECONDS = 30  # how often to check whether the indexer rewrote an index on disk
+
+# Words that point a query at one corpus; queries matching both or neither fan out to every corpus
+ROUTING_KEYWORDS = {
+    "po": {"po", "pos", "purchase", "order", "orders", "dump", "pending", "processed"},
+    "proforma": {"proforma", "invoice", "invoices", "invoiced", "bill", "billed"},
+}
+
+
+class QueryService:
+    """Multi-corpus retrieval + generation sharing one embedder and one LLM client."""
+
+    def __init__(self, index_paths=None, embeddings=None, llm=None, backend=None):
+        self.embeddings = embeddings or HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+        self.llm = llm or get_llm()
+        self.index_paths = index_paths or CORPUS_INDEX_PATHS
+        self.backends = {name: get_backend(name, self.embeddings, backend, index_path=path)
+                         for name, path in self.index_paths.items()}
+        self.stores = {}  # corpora that have been indexed, searched by route / search_by_vector
+        self.last_refresh = 0.0
+        self.refresh(force=True)
+        self.executor = ThreadPoolExecutor(max_workers=len(self.index_paths))
+
+    def refresh(self, force=False):
+        """Pick up indexes created or changed since the last check (e.g. after indexer.add_texts), at most every
+        REFRESH_INTERVAL_SECONDS."""
+        now = time.monotonic()
+        if not force and now - self.last_refresh < REFRESH_INTERVAL_SECONDS:
+            return
+        self.last_refresh = now
+        for name, backend in self.backends.items():
+            if backend.refresh():
+                print(f"Loaded {name} index ({backend.name})")
+            if backend.available():
+                self.stores[name] = backend
+            elif force:
+                print(f"No {name} index ({backend.name}), skipping.")
+
+    def route(self, query):
+        """Pick the corpora a query should be sent to."""
+        words = set(re.findall(r"\w+", query.lower()))
+        matched = [name for name, keywords in ROUTING_KEYWORDS.items() if words & keywords and name in self.stores]
+        if len(matched) == 1:
+            return matched
+        return list(self.stores)
+
+    def similarity_search_with_score(self, query, k=TOP_K, corpora=None, filter=None):
+        """Embed the query once, search the chosen corpora concurrently and merge hits by distance."""
+        corpora = corpora or self.route(query)
+        if not any(name in self.stores for name in corpora):
+            return []
+        with timed("embedding", kind="query"):
+            vector = self.embeddings.embed_query(query)
+        return self.search_by_vector(vector, k=k, corpora=corpora, filter=filter)
+
+    def search_by_vector(self, vector, k=TOP_K, corpora=None, filter=None):
+        """Search an already embedded query across the given corpora (default: all) and merge hits.
+
+        filter is a dict of metadata values (e.g. {"source": "PO_Dump_0412.xlsx"}) every hit must match.
+        """
+        self.refresh()
+        corpora = [name for name in (corpora or self.stores) if name in self.stores]
+        futures = {name: self.executor.submit(self._search_corpus, name, vector, k, filter) for name in corpora}
+
+        merged = []
+        for name, future in futures.items():
+            for doc, score in future.result():
+                tagged = Document(page_content=doc.page_content, metadata={**doc.metadata, "corpus": name})
+                merged.append((tagged, score))
+        # Same embedder and L2 metric everywhere, so distances are comparable across corpora
+        merged.sort(key=lambda pair: pair[1])
+        return merged[:k]
+
+    def _search_corpus(self, name, vector, k, filter=None):
+        backend = self.stores[name]
+        with timed("vector_search", corpus=name, backend=backend.name):
+            return backend.search_by_vector(vector, k, filter=filter)
+
+    def scope(self, corpora):
+        """Return a vector-store-like view restricted to the given corpora (None = auto routing)."""
+        return _ScopedSearch(self, corpora)
+
+    def stream(self, query, corpora=None, k=TOP_K):
+        """Same event stream as rag_stream.stream_rag_answer, over the selected corpora."""
+        return stream_rag_answer(self.scope(corpora), query, llm=self.llm, k=k)
+
+
+class _ScopedSearch:
+    def __init__(self, service, corpora):
+        self.service = service
+        self.corpora = corpora
+
+    def similarity_search_with_score(self, query, k=TOP_K):
+        return self.service.similarity_search_with_score(query, k=k, corpora=self.corpora)
+
+
+if __name__ == "__main__":
+    # Non-UI usage: python query_service.py "has PO 1234 been invoiced?"
+    service = QueryService()
+    for kind, value in service.stream(" ".join(sys.argv[1:])):
+        if kind == "sources":
+            print(f"Sources: {[doc.metadata.get('corpus') for doc in value]}")
+        elif kind == "token":
+            print(value, end="", flush=True)
+        else:
+            print(f"\n{value}")
@@ -0,0 +1,264 @@
+#This module serves the PO / proforma RAG pipeline over HTTP with FastAPI so several users and integrations
+# can query it at once. Query embeddings from concurrent requests are micro-batched, Ollama generations are
+# capped by a semaphore, and requests beyond the queue limits are rejected with 503 instead of piling up.
+#
+# Run:        uvicorn rag_api:app --port 8000   (or python rag_api.py)
+# Load test:  python ollama_stub.py & OLLAMA_BASE_URL=http://localhost:11435 python rag_api.py & python rag_api_load.py
+
+import asyncio
+import json
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from pydantic import BaseModel, Field
+from starlette.background import BackgroundTask
+from instrumentation import configure_logging, count, render_prometheus, timed
+from query_service import QueryService
+from reconcile import RECONCILE_PATH, STATUSES, ReconciliationStore
+from rag_stream import TOP_K, astream_answer
+
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_WAIT_MS = float(os.environ.get("EMBED_BATCH_WAIT_MS", "5"))
+MAX_PENDING_EMBEDDINGS = int(os.environ.get("MAX_PENDING_EMBEDDINGS", "256"))
+MAX_CONCURRENT_GENERATIONS = int(os.environ.get("MAX_CONCURRENT_GENERATIONS", "2"))
+MAX_PENDING_GENERATIONS = int(os.environ.get("MAX_PENDING_GENERATIONS", "16"))
+MAX_K = 50
+
+
+class Overloaded(Exception):
+    """Raised when a queue is full; mapped to HTTP 503."""
+
+
+class EmbeddingBatcher:
+    """Collects query texts from concurrent requests and embeds them in one model call."""
+
+    def __init__(self, embeddings, batch_size=EMBED_BATCH_SIZE, wait_ms=EMBED_BATCH_WAIT_MS,
+                 max_pending=MAX_PENDING_EMBEDDINGS):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.wait_seconds = wait_ms / 1000
+        self.queue = asyncio.Queue(maxsize=max_pending)
+        self.worker = None
+        self.batches = 0
+        self.embedded = 0
+
+    def start(self):
+        self.worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self.worker:
+            self.worker.cancel()
+
+    async def embed(self, text):
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self.queue.put_nowait((text, future))
+        except asyncio.QueueFull:
+            raise Overloaded("embedding queue is full")
+        return await future
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            deadline = loop.time() + self.wait_seconds
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                # embed_documents runs the model once for the whole batch; keep it off the event loop
+                vectors = await loop.run_in_executor(None, self.embeddings.embed_documents, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.embedded += len(batch)
+            for (_, future), vector in zip(batch, vectors):
+                if not future.done():
+                    future.set_result(vector)
+            count("embedding_batches_total")
+            count("embedding_batched_queries_total", len(batch))
+
+
+class GenerationLimiter:
+    """Caps concurrent Ollama calls and rejects new ones once too many are waiting."""
+
+    def __init__(self, max_concurrent=MAX_CONCURRENT_GENERATIONS, max_pending=MAX_PENDING_GENERATIONS):
+        self.semaphore = asyncio.Semaphore(max_concurrent)
+        self.max_pending = max_pending
+        self.pending = 0
+
+    def reserve(self):
+        """Take a pending place before the response starts; returns a release callback that is safe to call twice.
+
+        Check and increment run without an await in between, so concurrent requests cannot both pass the check.
+        """
+        if self.pending >= self.max_pending:
+            raise Overloaded("too many pending generations")
+        self.pending += 1
+        released = False
+
+        def release():
+            nonlocal released
+            if not released:
+                released = True
+                self.pending -= 1
+
+        return release
+
+    @asynccontextmanager
+    async def slot(self, release):
+        """Wait for a generation slot under a reservation from reserve(); releases it when done."""
+        try:
+            async with self.semaphore:
+                yield
+        finally:
+            release()
+
+
+class QueryRequest(BaseModel):
+    query: str
+    k: int = Field(TOP_K, gt=0, le=MAX_K)
+    corpora: Optional[List[str]] = None
+    filter: Optional[Dict[str, Any]] = None  # metadata values hits must match, e.g. {"source": "..."}
+    stream: bool = False
+
+
+state = {}
+
+
+@asynccontextmanager
+async def lifespan(app):
+    configure_logging()
+    service = QueryService()
+    state["service"] = service
+    state["batcher"] = EmbeddingBatcher(service.embeddings)
+    state["limiter"] = GenerationLimiter()
+    state["batcher"].start()
+    yield
+    await state["batcher"].stop()
+
+
+app = FastAPI(title="Kalika RAG API", lifespan=lifespan)
+
+
+def serialize_hit(doc, score=None):
+    hit = {"corpus": doc.metadata.get("corpus"), "text": doc.page_content, "metadata": doc.metadata}
+    if score is not None:
+        hit["score"] = float(score)
+    return hit
+
+
+async def retrieve(request):
+    service = state["service"]
+    corpora = request.corpora or service.route(request.query)
+    try:
+        with timed("embedding", kind="query"):
+            vector = await state["batcher"].embed(request.query)
+    except Overloaded as e:
+        count("api_rejected_total", reason="embedding_queue")
+        raise HTTPException(status_code=503, detail=str(e))
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, service.search_by_vector, vector, request.k, corpora, request.filter)
+
+
+@app.get("/health")
+async def health():
+    batcher = state["batcher"]
+    return {
+        "corpora": list(state["service"].stores),
+        "pending_embeddings": batcher.queue.qsize(),
+        "embedding_batches": batcher.batches,
+        "embedded_queries": batcher.embedded,
+        "pending_generations": state["limiter"].pending,
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    return render_prometheus()
+
+
+def load_reconciliation(status, limit):
+    store = ReconciliationStore(RECONCILE_PATH)
+    try:
+        results = store.results(status, limit)
+        return store.summary(), results.astype(object).where(results.notna(), None).to_dict("records")
+    finally:
+        store.conn.close()
+
+
+@app.get("/reconciliation")
+async def reconciliation(status: Optional[str] = None, limit: int = 100):
+    """PO / proforma reconciliation results written by reconcile.py, newest first."""
+    if status is not None and status not in STATUSES:
+        raise HTTPException(status_code=400, detail=f"status must be one of {', '.join(STATUSES)}")
+    loop = asyncio.get_running_loop()
+    summary, results = await loop.run_in_executor(None, load_reconciliation, status, limit)
+    return {"summary": summary, "results": results}
+
+
+@app.post("/retrieve")
+async def retrieve_endpoint(request: QueryRequest):
+    start = time.perf_counter()
+    hits = await retrieve(request)
+    return {
+        "hits": [serialize_hit(doc, score) for doc, score in hits],
+        "retrieval_seconds": time.perf_counter() - start,
+    }
+
+
+@app.post("/answer")
+async def answer_endpoint(request: QueryRequest):
+    start = time.perf_counter()
+    hits = await retrieve(request)
+    limiter = state["limiter"]
+    try:
+        # Reserved before any response is sent, so an overloaded stream gets a 503 rather than a cut-off 200
+        release = limiter.reserve()
+    except Overloaded as e:
+        count("api_rejected_total", reason="generation_queue")
+        raise HTTPException(status_code=503, detail=str(e))
+    events = astream_answer(request.query, hits, state["service"].llm, start=start)
+
+    if request.stream:
+        async def ndjson():
+            async with limiter.slot(release):
+                async for kind, value in events:
+                    if kind == "sources":
+                        value = [serialize_hit(doc) for doc in value]
+                    yield json.dumps({"event": kind, "data": value}) + "\n"
+
+        # The background task also releases the reservation when the client goes away before the body starts
+        return StreamingResponse(ndjson(), media_type="application/x-ndjson", background=BackgroundTask(release))
+
+    result = {"answer": "", "sources": [], "metrics": {}}
+    tokens = []
+    async with limiter.slot(release):
+        async for kind, value in events:
+            if kind == "sources":
+                result["sources"] = [serialize_hit(doc) for doc in value]
+            elif kind == "token":
+                tokens.append(value)
+            else:
+                result["metrics"] = value
+    result["answer"] = "".join(tokens)
+    return result
+
+
+if __name__ == "__main__":
+    uvicorn.run(app, host=os.environ.get("RAG_API_HOST", "0.0.0.0"), port=int(os.environ.get("RAG_API_PORT", "8000")))
@@ -0,0 +1,51 @@
+#This script fires concurrent queries at rag_api and reports latency percentiles and rejected (503) requests.
+
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+
+SAMPLE_QUERIES = [
+    "Which PO orders are still pending?",
+    "What is the total amount on the latest proforma invoice?",
+    "Has PO 4500012345 been invoiced?",
+    "List proforma invoices from Cummins",
+]
+
+
+async def worker(client, endpoint, requests_per_worker, latencies, statuses):
+    for i in range(requests_per_worker):
+        start = time.perf_counter()
+        response = await client.post(endpoint, json={"query": SAMPLE_QUERIES[i % len(SAMPLE_QUERIES)]})
+        latencies.append(time.perf_counter() - start)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+async def run(base_url, endpoint, concurrency, requests_per_worker):
+    latencies, statuses = [], {}
+    start = time.perf_counter()
+    async with httpx.AsyncClient(base_url=base_url, timeout=300) as client:
+        await asyncio.gather(*[
+            worker(client, endpoint, requests_per_worker, latencies, statuses) for _ in range(concurrency)
+        ])
+        health = (await client.get("/health")).json()
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    print(f"{len(latencies)} requests to {endpoint} in {elapsed:.2f}s ({len(latencies) / elapsed:.1f} req/s)")
+    print(f"status codes: {statuses}")
+    print(f"p50 {statistics.median(latencies):.3f}s  p95 {latencies[int(len(latencies) * 0.95) - 1]:.3f}s  "
+          f"max {latencies[-1]:.3f}s")
+    print(f"server: {health}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Concurrent load test for rag_api")
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--endpoint", default="/answer", choices=["/answer", "/retrieve"])
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--requests", type=int, default=5, help="requests per concurrent client")
+    args = parser.parse_args()
+    asyncio.run(run(args.base_url, args.endpoint, args.concurrency, args.requests))
@@ -0,0 +1,32 @@
+#This Streamlit app answers questions over both the PO and proforma invoice indexes from a single process.
+# Indexes are built by the PO / proforma apps; this one only loads them once and queries them together.
+
+import streamlit as st
+from query_service import QueryService
+from rag_stream import write_streaming_answer
+
+SCOPES = {
+    "Auto": None,
+    "PO": ["po"],
+    "Proforma": ["proforma"],
+    "Both": ["po", "proforma"],
+}
+
+
+# One embedder, one LLM client and both indexes per server process
+@st.cache_resource
+def get_query_service():
+    return QueryService()
+
+
+# Streamlit UI
+st.title("RAG System for PO and Proforma Invoice Analysis")
+
+service = get_query_service()
+if not service.stores:
+    st.warning("No PO or proforma index found. Please build the indexes first.")
+
+scope = st.radio("Search in:", list(SCOPES), horizontal=True)
+query = st.text_input("Enter your query about PO Orders or Proforma Invoices:")
+if query and service.stores:
+    write_streaming_answer(service.scope(SCOPES[scope]), query, llm=service.llm)
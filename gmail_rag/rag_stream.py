@@ -0,0 +1,152 @@
+#This module streams RAG answers token by token from Ollama so the Streamlit apps (and any non-UI caller)
+# can show retrieved sources right after retrieval and print the answer while Llama2 is still generating.
+
+import os
+import time
+from langchain_community.llms import Ollama
+from context_budget import CONTEXT_TOKEN_BUDGET, assemble_context, estimate_tokens
+from instrumentation import count, observe, timed
+
+OLLAMA_MODEL = "llama2:latest"
+OLLAMA_BASE_URL = os.environ.get("OLLAMA_BASE_URL", "http://localhost:11434")  # point at ollama_stub.py for load tests
+TOP_K = 8  # fetch a few extra chunks; assemble_context trims them to the token budget
+
+# Same wording as the default RetrievalQA "stuff" prompt, so answers stay comparable
+PROMPT_TEMPLATE = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+
+def get_llm(model=OLLAMA_MODEL, base_url=OLLAMA_BASE_URL):
+    """Create the Ollama client used for generation."""
+    return Ollama(model=model, base_url=base_url)
+
+
+def retrieve_sources(vector_store, query, k=TOP_K):
+    """Return the top-k (document, score) pairs for the query."""
+    return vector_store.similarity_search_with_score(query, k=k)
+
+
+def build_prompt(query, docs_and_scores, max_tokens=CONTEXT_TOKEN_BUDGET):
+    """Pack the retrieved chunks into the token budget and fill the QA prompt.
+
+    Returns (prompt, used_docs, context_stats).
+    """
+    context, used_docs, stats = assemble_context(query, docs_and_scores, max_tokens=max_tokens)
+    prompt = PROMPT_TEMPLATE.format(context=context, question=query)
+    stats["prompt_tokens"] = estimate_tokens(prompt)
+    return prompt, used_docs, stats
+
+
+def stream_rag_answer(vector_store, query, llm=None, k=TOP_K):
+    """Yield ("sources", docs) after retrieval, ("token", text) per generated chunk, then ("metrics", dict)."""
+    start = time.perf_counter()
+    with timed("retrieval"):
+        docs_and_scores = retrieve_sources(vector_store, query, k=k)
+    prompt, docs, context_stats = build_prompt(query, docs_and_scores)
+    retrieved_at = time.perf_counter()
+    yield "sources", docs
+
+    llm = llm or get_llm()
+    generation_start = time.perf_counter()
+    first_token_at = None
+    token_count = 0
+    with timed("llm_generation"):
+        for chunk in llm.stream(prompt):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            token_count += 1
+            yield "token", chunk
+    end = time.perf_counter()
+    yield "metrics", {
+        **generation_metrics(start, retrieved_at, generation_start, first_token_at, end, token_count),
+        **context_stats,
+    }
+
+
+async def astream_answer(query, docs_and_scores, llm, start=None):
+    """Async variant for callers that already have the hits (e.g. rag_api): same events as stream_rag_answer."""
+    start = start or time.perf_counter()
+    prompt, docs, context_stats = build_prompt(query, docs_and_scores)
+    retrieved_at = time.perf_counter()
+    yield "sources", docs
+
+    generation_start = time.perf_counter()
+    first_token_at = None
+    token_count = 0
+    with timed("llm_generation"):
+        async for chunk in llm.astream(prompt):
+            if first_token_at is None:
+                first_token_at = time.perf_counter()
+            token_count += 1
+            yield "token", chunk
+    end = time.perf_counter()
+    yield "metrics", {
+        **generation_metrics(start, retrieved_at, generation_start, first_token_at, end, token_count),
+        **context_stats,
+    }
+
+
+def generation_metrics(start, retrieved_at, generation_start, first_token_at, end, token_count):
+    """Latency / throughput numbers for one answer."""
+    # Ollama streams roughly one token per chunk, so the chunk count is used as the token count
+    decode_seconds = end - (first_token_at or end)
+    observe("llm_time_to_first_token_seconds", (first_token_at or end) - start)
+    count("llm_generated_tokens", token_count)
+    return {
+        "retrieval_seconds": retrieved_at - start,
+        "time_to_first_token": (first_token_at or end) - start,
+        "generation_seconds": end - generation_start,
+        "total_seconds": end - start,
+        "tokens": token_count,
+        "tokens_per_second": token_count / decode_seconds if decode_seconds > 0 else 0.0,
+    }
+
+
+def answer_rag(vector_store, query, llm=None, k=TOP_K):
+    """Non-streaming helper: consume the stream and return answer, sources and metrics."""
+    result = {"answer": "", "sources": [], "metrics": {}}
+    tokens = []
+    for kind, value in stream_rag_answer(vector_store, query, llm=llm, k=k):
+        if kind == "sources":
+            result["sources"] = value
+        elif kind == "token":
+            tokens.append(value)
+        else:
+            result["metrics"] = value
+    result["answer"] = "".join(tokens)
+    return result
+
+
+def write_streaming_answer(vector_store, query, llm=None, k=TOP_K):
+    """Render sources and the streamed answer into the current Streamlit page."""
+    import streamlit as st
+
+    events = stream_rag_answer(vector_store, query, llm=llm, k=k)
+    _, docs = next(events)
+    with st.expander(f"Sources ({len(docs)})"):
+        for i, doc in enumerate(docs, start=1):
+            corpus = doc.metadata.get("corpus")
+            label = f"[{i}] ({corpus})" if corpus else f"[{i}]"
+            st.text(f"{label} {doc.page_content[:500]}")
+
+    metrics = {}
+
+    def tokens():
+        for kind, value in events:
+            if kind == "token":
+                yield value
+            else:
+                metrics.update(value)
+
+    st.write("Answer:")
+    st.write_stream(tokens())
+    st.caption(
+        f"Time to first token: {metrics['time_to_first_token']:.2f}s | "
+        f"{metrics['tokens_per_second']:.1f} tokens/s | {metrics['tokens']} tokens | "
+        f"prompt ~{metrics['prompt_tokens']} tokens from {metrics['used_chunks']} chunks"
+    )
+    return metrics
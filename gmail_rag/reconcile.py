@@ -0,0 +1,592 @@
+#This module reconciles PO dump rows against proforma invoices, so "which POs have been invoiced?" is a table
+# lookup instead of a manual search or an LLM question. Extracted PO lines and proforma header / line items are
+# kept in SQLite (reconcile.db) and only new or changed attachments are parsed again. Matching is done with hash
+# joins on the normalized PO number, then on vendor + amount, with a fuzzy PO number match inside the same vendor
+# as the last resort, and every PO ends up pending, matched or mismatched (with the reasons).
+#
+# Run:    python reconcile.py                       # sync PO_Dump/ + proforma_invoice/ and reconcile
+#         python reconcile.py --show mismatched     # print results
+#         python reconcile.py --bench 300000        # time parsing + matching on synthetic data
+
+import argparse
+import difflib
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import time
+
+import numpy as np
+import pandas as pd
+
+from instrumentation import count, log_event, timed
+from job_lock import JobLock
+
+RECONCILE_PATH = "reconcile.db"
+# Where scheduler.py / PO_s3store.py / proforma_s3store.py save attachments
+PO_DIRECTORIES = ("PO_Dump",)
+PROFORMA_DIRECTORIES = ("proforma_invoice",)
+
+STATUSES = ("pending", "matched", "mismatched")
+AMOUNT_TOLERANCE = 1.0  # rupees; rounding differences between the ERP export and the invoice
+AMOUNT_TOLERANCE_RATIO = 0.001
+VENDOR_SIMILARITY = 0.85  # difflib ratio above which two normalized vendor names are the same vendor
+PO_NUMBER_SIMILARITY = 0.8  # for the fuzzy fallback (typos, transposed digits)
+
+# PO dump header aliases -> column
+PO_COLUMNS = {
+    "po_number": ("po number", "po no", "po no.", "po", "purchase order", "purchase order no"),
+    "vendor": ("vendor", "vendor name", "supplier", "supplier name"),
+    "item": ("item", "material", "description", "item description"),
+    "qty": ("qty", "quantity", "order qty"),
+    "rate": ("rate", "price", "unit price", "net price"),
+    "amount": ("amount", "value", "net value", "order value"),
+    "status": ("status",),
+}
+REQUIRED_PO_COLUMNS = ("po_number", "vendor", "amount")
+
+INVOICE_NO_RE = re.compile(r"(?:Proforma\s+)?Invoice\s*No\.?\s*[:\-]?\s*([A-Za-z0-9/\-]+)", re.I)
+PO_NO_RE = re.compile(r"\bP\.?\s?O\.?\s*(?:No|Number)\.?\s*[:\-]?\s*([A-Za-z0-9/\-]+)", re.I)
+VENDOR_RE = re.compile(r"^\s*(?:Vendor|Supplier)\s*(?:Name)?\s*[:\-]\s*(.+?)\s*$", re.I)
+TOTAL_RE = re.compile(r"^\s*(?:Grand\s+)?Total\s*(?:Amount)?\s*[:\-]?\s*(?:Rs\.?|INR)?\s*([\d,]+(?:\.\d+)?)\s*$", re.I)
+LINE_RE = re.compile(r"^\s*(.+?)\s+(\d+(?:\.\d+)?)\s+([\d,]+\.\d{2})\s+([\d,]+\.\d{2})\s*$")
+
+VENDOR_STOPWORDS = {"pvt", "private", "ltd", "limited", "india", "the", "co", "company", "inc", "llp"}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    sha256 TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    processed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS po_lines (
+    source TEXT NOT NULL,
+    po_number TEXT NOT NULL,
+    vendor TEXT,
+    item TEXT,
+    qty REAL,
+    rate REAL,
+    amount REAL,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS po_lines_source ON po_lines (source);
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_no TEXT NOT NULL,
+    source TEXT NOT NULL,
+    po_number TEXT,
+    vendor TEXT,
+    total REAL
+);
+CREATE INDEX IF NOT EXISTS invoices_source ON invoices (source);
+CREATE TABLE IF NOT EXISTS invoice_lines (
+    invoice_no TEXT NOT NULL,
+    source TEXT NOT NULL,
+    item TEXT,
+    qty REAL,
+    rate REAL,
+    amount REAL
+);
+CREATE INDEX IF NOT EXISTS invoice_lines_source ON invoice_lines (source);
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    po_number TEXT,
+    vendor TEXT,
+    po_amount REAL,
+    invoice_numbers TEXT,
+    invoiced_amount REAL,
+    match TEXT,
+    status TEXT NOT NULL,
+    reasons TEXT,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_status ON results (status);
+"""
+RESULT_COLUMNS = ["key", "po_number", "vendor", "po_amount", "invoice_numbers", "invoiced_amount", "match",
+                  "status", "reasons"]
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def to_number(value):
+    try:
+        return float(str(value).replace(",", ""))
+    except ValueError:
+        return None
+
+
+# Parsing
+
+def _po_column_map(columns):
+    lookup = {str(column).strip().lower(): column for column in columns}
+    found = {}
+    for name, aliases in PO_COLUMNS.items():
+        for alias in aliases:
+            if alias in lookup:
+                found[name] = lookup[alias]
+                break
+    return found
+
+
+def parse_po_frame(df, source):
+    """Normalize a PO dump DataFrame (ERP export columns) to po_lines rows."""
+    mapping = _po_column_map(df.columns)
+    missing = [name for name in REQUIRED_PO_COLUMNS if name not in mapping]
+    if missing:
+        raise ValueError(f"PO dump has no {', '.join(missing)} column")
+    lines = pd.DataFrame({name: df[column] for name, column in mapping.items()})
+    for name in PO_COLUMNS:
+        if name not in lines:
+            lines[name] = None
+    lines = lines[lines["po_number"].notna()]
+    lines["po_number"] = lines["po_number"].astype(str).str.strip().str.replace(r"\.0$", "", regex=True)
+    for name in ("qty", "rate", "amount"):
+        lines[name] = pd.to_numeric(lines[name], errors="coerce")
+    lines["source"] = source
+    return lines[["source", "po_number", "vendor", "item", "qty", "rate", "amount", "status"]]
+
+
+def parse_po_workbook(path):
+    df = pd.read_excel(path)
+    if len(_po_column_map(df.columns)) < len(REQUIRED_PO_COLUMNS):
+        # Some exports put a title block above the header row
+        raw = pd.read_excel(path, header=None)
+        for i in range(min(20, len(raw))):
+            if len(_po_column_map(raw.iloc[i].dropna())) >= len(REQUIRED_PO_COLUMNS):
+                df = raw.iloc[i + 1:].set_axis([str(c) for c in raw.iloc[i]], axis=1)
+                break
+    return parse_po_frame(df, path)
+
+
+def parse_proforma_lines(lines, source):
+    """Header fields and line items from the text of one proforma invoice; returns (invoice, items)."""
+    invoice = {"invoice_no": None, "source": source, "po_number": None, "vendor": None, "total": None}
+    items = []
+    for line in lines:
+        if invoice["invoice_no"] is None and (m := INVOICE_NO_RE.search(line)):
+            invoice["invoice_no"] = m.group(1)
+        elif invoice["po_number"] is None and (m := PO_NO_RE.search(line)):
+            invoice["po_number"] = m.group(1)
+        elif invoice["vendor"] is None and (m := VENDOR_RE.match(line)):
+            invoice["vendor"] = m.group(1)
+        elif m := TOTAL_RE.match(line):
+            invoice["total"] = to_number(m.group(1))
+        elif m := LINE_RE.match(line):
+            item, qty, rate, amount = m.groups()
+            items.append({"item": item, "qty": float(qty), "rate": to_number(rate), "amount": to_number(amount)})
+    if invoice["invoice_no"] is None:
+        invoice["invoice_no"] = os.path.splitext(os.path.basename(source))[0]
+    if invoice["total"] is None and items:
+        invoice["total"] = round(sum(item["amount"] for item in items), 2)
+    for item in items:
+        item.update(invoice_no=invoice["invoice_no"], source=source)
+    return invoice, items
+
+
+def parse_proforma_pdf(path):
+    from extractors import pdf_to_text
+
+    return parse_proforma_lines(pdf_to_text(path).splitlines(), path)
+
+
+# Matching
+
+def normalize_distinct(values, key):
+    """values.map(key), calling key once per distinct value; PO numbers, vendors and items repeat a lot."""
+    unique = values.dropna().unique()
+    return values.map(dict(zip(unique, map(key, unique))))
+
+
+def po_number_key(number):
+    """Digits only, without leading zeros: '4500000012', 'PO-4500000012' and 4500000012.0 are one key."""
+    number = re.sub(r"\.0$", "", str(number)).strip()
+    return re.sub(r"\D", "", number).lstrip("0") or number.upper()
+
+
+def vendor_name_key(name):
+    words = re.sub(r"[^a-z0-9 ]", " ", str(name).lower()).split()
+    return " ".join(word for word in words if word not in VENDOR_STOPWORDS)
+
+
+def item_name_key(name):
+    return re.sub(r"[^a-z0-9]", "", str(name).lower())
+
+
+def isin(values, keys):
+    """values.isin(keys) as one hash lookup (Series.isin goes row by row on Arrow-backed strings)."""
+    return pd.Index(pd.unique(np.asarray(keys, dtype=object))).get_indexer(np.asarray(values, dtype=object)) >= 0
+
+
+def same_vendor(a, b):
+    """Elementwise over two Series of vendor keys: equal, or close enough by difflib ratio."""
+    same = (a == b).fillna(False).astype(bool)
+    for i in same.index[~same & a.notna() & b.notna()]:
+        same[i] = difflib.SequenceMatcher(None, a[i], b[i]).ratio() >= VENDOR_SIMILARITY
+    return same & a.fillna("").ne("")
+
+
+def amount_tolerance(amounts):
+    return np.maximum(AMOUNT_TOLERANCE, np.abs(amounts) * AMOUNT_TOLERANCE_RATIO)
+
+
+def vendor_amount_keys(vendor_keys, amounts):
+    cents = (pd.to_numeric(amounts) * 100).round().astype("Int64").astype(str)
+    return vendor_keys.fillna("").astype(str) + "|" + cents
+
+
+def assign_invoices(headers, invoices):
+    """Give every invoice the PO key it belongs to (or None) and the rule that matched it."""
+    invoices = invoices.copy()
+    invoices["matched_po"] = invoices["po_key"].where(isin(invoices["po_key"], headers.index))
+    invoices["match"] = np.where(invoices["matched_po"].notna(), "po_number", None)
+    # A PO number match with another vendor or amount may be a mistyped number that happens to exist; such
+    # invoices move to an open PO below only if that PO has exactly their vendor and amount
+    claimed = invoices["matched_po"]
+    vendor_ok = same_vendor(invoices["vendor_key"], claimed.map(headers["vendor_key"]))
+    amount_ok = (invoices["total"] - claimed.map(headers["po_amount"])).abs() <= amount_tolerance(invoices["total"])
+    suspect = claimed.notna() & ~(vendor_ok & amount_ok)
+
+    # Fallback 1: hash join on (vendor, amount) against POs no invoice claimed by number
+    open_pos = headers[~isin(headers.index, invoices.loc[~suspect, "matched_po"].dropna())]
+    candidates = pd.Series(open_pos.index, index=vendor_amount_keys(open_pos["vendor_key"], open_pos["po_amount"]))
+    candidates = candidates[~candidates.index.duplicated(keep=False)]  # ambiguous keys are not matched
+    unmatched = invoices["matched_po"].isna() | suspect
+    found = vendor_amount_keys(invoices.loc[unmatched, "vendor_key"], invoices.loc[unmatched, "total"]).map(candidates)
+    invoices.loc[found.dropna().index, "matched_po"] = found.dropna()
+    invoices.loc[found.dropna().index, "match"] = "vendor_amount"
+
+    # Fallback 2: closest PO number among the same vendor's still open POs
+    unmatched = invoices["matched_po"].isna() & invoices["po_key"].fillna("").ne("")
+    if unmatched.any():
+        open_pos = headers[~isin(headers.index, invoices["matched_po"].dropna())]
+        by_vendor = open_pos.reset_index().groupby("vendor_key")["po_key"].apply(list).to_dict()
+        for i, row in invoices[unmatched].iterrows():
+            close = difflib.get_close_matches(row["po_key"], by_vendor.get(row["vendor_key"], []), n=1,
+                                              cutoff=PO_NUMBER_SIMILARITY)
+            if close:
+                invoices.at[i, "matched_po"] = close[0]
+                invoices.at[i, "match"] = "fuzzy_po_number"
+                by_vendor[row["vendor_key"]].remove(close[0])
+    return invoices
+
+
+def join_per_key(keys, values):
+    """", ".join of the sorted distinct values per key; the Python join only runs for keys with several values."""
+    frame = pd.DataFrame({"key": keys.values, "value": values.astype(str).values}).drop_duplicates()
+    frame = frame.sort_values("value")
+    several = frame["key"].duplicated(keep=False)
+    return pd.concat([frame[~several].set_index("key")["value"],
+                      frame[several].groupby("key")["value"].agg(", ".join)])
+
+
+def line_differences(po_lines, invoice_lines, invoices, po_keys):
+    """Per PO key, the items whose quantity or amount differs between the PO and its invoices."""
+    if not len(po_keys):
+        return {}
+    po_items = (po_lines[isin(po_lines["po_key"], po_keys)]
+                .groupby(["po_key", "item_key"]).agg(item=("item", "first"), po_qty=("qty", "sum"),
+                                                     po_amount=("amount", "sum")))
+    owner = invoices.dropna(subset=["matched_po"]).set_index("invoice_no")["matched_po"]
+    billed = invoice_lines.assign(po_key=invoice_lines["invoice_no"].map(owner))
+    billed = (billed[isin(billed["po_key"], po_keys)]
+              .groupby(["po_key", "item_key"]).agg(invoice_item=("item", "first"), invoice_qty=("qty", "sum"),
+                                                   invoice_amount=("amount", "sum")))
+    both = po_items.join(billed, how="outer").fillna({"po_qty": 0, "invoice_qty": 0, "po_amount": 0,
+                                                      "invoice_amount": 0})
+    differs = (both["po_qty"] != both["invoice_qty"]) | \
+        ((both["po_amount"] - both["invoice_amount"]).abs() > amount_tolerance(both["po_amount"]))
+    reasons = {}
+    for (po_key, _), row in both[differs].iterrows():
+        name = row["item"] if isinstance(row["item"], str) else row["invoice_item"]
+        reasons.setdefault(po_key, []).append(f"{name}: qty {row['po_qty']:g} ordered vs {row['invoice_qty']:g} invoiced")
+    return reasons
+
+
+def latest_dump_lines(po_lines):
+    """Keep each PO's lines from the newest dump that contains it.
+
+    PO dumps are snapshots that repeat every open PO, so summing lines across dumps would count a PO once per
+    dump. Newest is by processed_at when present (ReconciliationStore.load), then by source path.
+    """
+    order = po_lines["processed_at"] if "processed_at" in po_lines else pd.Series(0.0, index=po_lines.index)
+    dumps = (pd.DataFrame({"po_key": po_lines["po_key"], "source": po_lines["source"], "order": order})
+             .drop_duplicates(["po_key", "source"]).sort_values(["order", "source"])
+             .drop_duplicates("po_key", keep="last"))
+    def keys(frame):
+        return frame["po_key"].astype(str) + "\0" + frame["source"].astype(str)
+
+    return po_lines[isin(keys(po_lines), keys(dumps))]
+
+
+def match_documents(po_lines, invoices, invoice_lines):
+    """Reconcile all POs and invoices; returns one row per PO plus one per invoice that matches no PO."""
+    po_lines = po_lines.assign(po_key=normalize_distinct(po_lines["po_number"], po_number_key),
+                               vendor_key=normalize_distinct(po_lines["vendor"], vendor_name_key),
+                               item_key=normalize_distinct(po_lines["item"].fillna(""), item_name_key))
+    po_lines = latest_dump_lines(po_lines)
+    # An invoice received twice (e.g. a corrected copy) counts once, with the line items of the copy kept
+    invoices = invoices.drop_duplicates("invoice_no", keep="last")
+    invoice_lines = invoice_lines[isin(invoice_lines["source"], invoices["source"])]
+    invoices = invoices.assign(po_key=normalize_distinct(invoices["po_number"].fillna(""), po_number_key),
+                               vendor_key=normalize_distinct(invoices["vendor"], vendor_name_key))
+    invoice_lines = invoice_lines.assign(item_key=normalize_distinct(invoice_lines["item"].fillna(""), item_name_key))
+
+    headers = po_lines.groupby("po_key").agg(po_number=("po_number", "first"), vendor=("vendor", "first"),
+                                             vendor_key=("vendor_key", "first"), po_amount=("amount", "sum"))
+    invoices = assign_invoices(headers, invoices)
+    invoices["vendor_ok"] = same_vendor(invoices["vendor_key"], invoices["matched_po"].map(headers["vendor_key"]))
+
+    matched = invoices.dropna(subset=["matched_po"])
+    billed = matched.groupby("matched_po").agg(
+        invoiced_amount=("total", "sum"),
+        vendor_ok=("vendor_ok", "all"),
+        invoice_vendor=("vendor", "first"),
+    )
+    billed["invoice_numbers"] = join_per_key(matched["matched_po"], matched["invoice_no"])
+    billed["match"] = join_per_key(matched["matched_po"], matched["match"])
+    results = headers.join(billed, how="left")
+    results["invoiced_amount"] = results["invoiced_amount"].fillna(0.0)
+    has_invoice = results["invoice_numbers"].notna()
+    difference = results["invoiced_amount"] - results["po_amount"]
+    tolerance = amount_tolerance(results["po_amount"])
+    totals_agree = has_invoice & (difference.abs() <= tolerance)
+    item_reasons = line_differences(po_lines, invoice_lines, invoices, results.index[totals_agree])
+
+    statuses, reasons = [], []
+    for po_key, row, diff, tol in zip(results.index, results.itertuples(), difference, tolerance):
+        if not isinstance(row.invoice_numbers, str):
+            statuses.append("pending")
+            reasons.append("")
+        elif not row.vendor_ok:
+            statuses.append("mismatched")
+            reasons.append(f"vendor differs: PO {row.vendor!r}, invoice {row.invoice_vendor!r}")
+        elif diff > tol:
+            statuses.append("mismatched")
+            reasons.append(f"over-invoiced by {diff:.2f}")
+        elif diff < -tol:
+            statuses.append("pending")
+            reasons.append(f"partially invoiced: {row.invoiced_amount:.2f} of {row.po_amount:.2f}")
+        elif po_key in item_reasons:
+            statuses.append("mismatched")
+            reasons.append("; ".join(item_reasons[po_key]))
+        else:
+            statuses.append("matched")
+            reasons.append("")
+    results["status"] = statuses
+    results["reasons"] = reasons
+    results["key"] = "po:" + results.index.astype(str)
+    results = results.reset_index()
+
+    orphans = invoices[invoices["matched_po"].isna()]
+    orphans = pd.DataFrame({
+        "key": "invoice:" + orphans["invoice_no"].astype(str),
+        "po_number": orphans["po_number"],
+        "vendor": orphans["vendor"],
+        "po_amount": np.nan,
+        "invoice_numbers": orphans["invoice_no"],
+        "invoiced_amount": orphans["total"],
+        "match": None,
+        "status": "mismatched",
+        "reasons": "no matching PO",
+    })
+    return pd.concat([results[RESULT_COLUMNS], orphans[RESULT_COLUMNS]], ignore_index=True)
+
+
+# Storage
+
+class ReconciliationStore:
+    """Extracted documents and the latest results in one SQLite file."""
+
+    def __init__(self, path=RECONCILE_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def sync_sources(self, po_directories=PO_DIRECTORIES, proforma_directories=PROFORMA_DIRECTORIES):
+        """Parse attachments that are new or changed since the last sync and forget deleted ones."""
+        wanted = {}
+        for kind, directories, extensions in (("po", po_directories, (".xlsx", ".xls")),
+                                              ("proforma", proforma_directories, (".pdf",))):
+            for directory in directories:
+                if os.path.isdir(directory):
+                    for filename in sorted(os.listdir(directory)):
+                        if filename.lower().endswith(extensions):
+                            wanted[os.path.abspath(os.path.join(directory, filename))] = kind
+        known = dict(self.conn.execute("SELECT path, sha256 FROM sources"))
+
+        changed = 0
+        for path in set(known) - set(wanted):
+            self._forget(path)
+            changed += 1
+        for path, kind in wanted.items():
+            digest = file_hash(path)
+            if known.get(path) == digest:
+                continue
+            changed += 1
+            try:
+                with timed("reconcile_extract", kind=kind):
+                    parsed = parse_po_workbook(path) if kind == "po" else parse_proforma_pdf(path)
+                status, error = "ok", None
+            except Exception as e:
+                parsed, status, error = None, "failed", repr(e)
+                count("reconcile_sources_total", kind=kind, status="failed")
+                log_event("reconcile_extract_failed", level=logging.ERROR, path=path, error=error)
+            with self.conn:
+                self._forget(path, commit=False)
+                if parsed is not None and kind == "po":
+                    self.conn.executemany(
+                        "INSERT INTO po_lines (source, po_number, vendor, item, qty, rate, amount, status) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        parsed.astype(object).where(parsed.notna(), None).itertuples(index=False, name=None))
+                elif parsed is not None:
+                    self.add_invoices([parsed[0]], parsed[1], commit=False)
+                self.conn.execute(
+                    "INSERT INTO sources (path, kind, sha256, status, error, processed_at) VALUES (?, ?, ?, ?, ?, ?)",
+                    (path, kind, digest, status, error, time.time()))
+        return changed
+
+    def add_invoices(self, invoices, items, commit=True):
+        self.conn.executemany(
+            "INSERT INTO invoices (invoice_no, source, po_number, vendor, total) "
+            "VALUES (:invoice_no, :source, :po_number, :vendor, :total)", invoices)
+        self.conn.executemany(
+            "INSERT INTO invoice_lines (invoice_no, source, item, qty, rate, amount) "
+            "VALUES (:invoice_no, :source, :item, :qty, :rate, :amount)", items)
+        if commit:
+            self.conn.commit()
+
+    def _forget(self, path, commit=True):
+        for table in ("po_lines", "invoices", "invoice_lines"):
+            self.conn.execute(f"DELETE FROM {table} WHERE source = ?", (path,))
+        self.conn.execute("DELETE FROM sources WHERE path = ?", (path,))
+        if commit:
+            self.conn.commit()
+
+    def load(self):
+        """(po_lines, invoices, invoice_lines) for match_documents; PO lines carry their dump's processed_at."""
+        return (pd.read_sql("SELECT p.source, po_number, vendor, item, qty, rate, amount, p.status, processed_at "
+                            "FROM po_lines p JOIN sources s ON s.path = p.source", self.conn),
+                pd.read_sql("SELECT invoice_no, source, po_number, vendor, total FROM invoices i "
+                            "JOIN sources s ON s.path = i.source ORDER BY processed_at, source", self.conn),
+                pd.read_sql("SELECT invoice_no, source, item, qty, rate, amount FROM invoice_lines", self.conn))
+
+    def save_results(self, results):
+        """Write only rows whose outcome changed; returns {status: rows that moved into it}."""
+        previous = {row[0]: row[1:] for row in self.conn.execute(f"SELECT {', '.join(RESULT_COLUMNS)} FROM results")}
+        rows = results.astype(object).where(results.notna(), None)
+        status = RESULT_COLUMNS.index("status")
+        now = time.time()
+        updates, moved = [], {}
+        for row in rows.itertuples(index=False, name=None):
+            old = previous.pop(row[0], None)
+            if old != row[1:]:
+                updates.append(row + (now,))
+                if old is None or old[status - 1] != row[status]:
+                    moved[row[status]] = moved.get(row[status], 0) + 1
+        with self.conn:
+            self.conn.executemany(
+                f"INSERT OR REPLACE INTO results ({', '.join(RESULT_COLUMNS)}, updated_at) "
+                f"VALUES ({', '.join('?' * (len(RESULT_COLUMNS) + 1))})", updates)
+            self.conn.executemany("DELETE FROM results WHERE key = ?", [(key,) for key in previous])
+        return moved
+
+    def results(self, status=None, limit=None):
+        query = f"SELECT {', '.join(RESULT_COLUMNS)}, updated_at FROM results"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY updated_at DESC, key"
+        if limit:
+            query += " LIMIT ?"
+            params.append(limit)
+        return pd.read_sql(query, self.conn, params=params)
+
+    def summary(self):
+        return dict(self.conn.execute("SELECT status, COUNT(*) FROM results GROUP BY status"))
+
+
+def run_reconciliation(store=None, po_directories=PO_DIRECTORIES, proforma_directories=PROFORMA_DIRECTORIES,
+                       force=False):
+    """Sync attachments and, if anything changed, recompute the matches. Safe to call from several processes."""
+    store = store or ReconciliationStore()
+    lock = JobLock("reconcile")
+    lock.acquire(blocking=True)
+    try:
+        with timed("reconcile_sync"):
+            changed = store.sync_sources(po_directories, proforma_directories)
+        if not changed and not force:
+            return {}
+        with timed("reconcile_match"):
+            results = match_documents(*store.load())
+        moved = store.save_results(results)
+    finally:
+        lock.release()
+    for status, n in moved.items():
+        count("reconcile_transitions_total", n, status=status)
+    log_event("reconciled", changed_sources=changed, moved=moved, **store.summary())
+    return moved
+
+
+def bench(pos, lines_per_po=3, seed=0):
+    """Time parsing and matching on synthetic POs / proformas (no files, no database)."""
+    from synthetic_docs import make_reconciliation_set
+
+    records, proformas = make_reconciliation_set(pos, lines_per_po, seed=seed)
+    start = time.perf_counter()
+    po_lines = parse_po_frame(pd.DataFrame(records), "bench.xlsx")
+    invoices, items = [], []
+    for n, lines in enumerate(proformas):
+        invoice, invoice_items = parse_proforma_lines(lines, f"bench_{n}.pdf")
+        invoices.append(invoice)
+        items.extend(invoice_items)
+    parsed = time.perf_counter()
+    results = match_documents(po_lines, pd.DataFrame(invoices), pd.DataFrame(items))
+    matched = time.perf_counter()
+    print(f"{len(po_lines)} PO rows, {len(invoices)} invoices, {len(items)} invoice lines")
+    print(f"parse {parsed - start:.2f}s  match {matched - parsed:.2f}s")
+    print(results["status"].value_counts().to_string())
+    print(results["match"].value_counts().to_string())
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Reconcile PO dumps against proforma invoices")
+    parser.add_argument("--db", default=RECONCILE_PATH)
+    parser.add_argument("--po-dir", action="append", default=None, help=f"default: {', '.join(PO_DIRECTORIES)}")
+    parser.add_argument("--proforma-dir", action="append", default=None,
+                        help=f"default: {', '.join(PROFORMA_DIRECTORIES)}")
+    parser.add_argument("--force", action="store_true", help="recompute matches even if no attachment changed")
+    parser.add_argument("--show", choices=STATUSES, help="print results with this status instead of syncing")
+    parser.add_argument("--export", default=None, help="write all results to this CSV file")
+    parser.add_argument("--bench", type=int, default=None, metavar="POS", help="benchmark on synthetic data")
+    args = parser.parse_args()
+
+    if args.bench:
+        bench(args.bench)
+        return
+    store = ReconciliationStore(args.db)
+    if args.show or args.export:
+        results = store.results(args.show)
+        if args.export:
+            results.to_csv(args.export, index=False)
+            print(f"Wrote {len(results)} results to {args.export}")
+        else:
+            print(results.to_string(index=False))
+        return
+    moved = run_reconciliation(store, args.po_dir or PO_DIRECTORIES, args.proforma_dir or PROFORMA_DIRECTORIES,
+                               args.force)
+    print(f"Changed: {moved or 'nothing'}  Totals: {store.summary()}")
+
+
+if __name__ == "__main__":
+    main()
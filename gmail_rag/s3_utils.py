@@ -0,0 +1,43 @@
+#This module wraps the S3 calls shared by the store scripts, the scheduler and the benchmarks.
+
+import boto3
+from botocore.exceptions import ClientError
+from instrumentation import timed
+
+S3_BUCKET = "kalika-rag"
+
+
+def make_s3_client(access_key=None, secret_key=None, endpoint_url=None):
+    """Create an S3 client; endpoint_url points it at MinIO or another S3-compatible store."""
+    return boto3.client(
+        "s3",
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        endpoint_url=endpoint_url,
+    )
+
+
+def file_exists_in_s3(s3_client, bucket, key):
+    """Check if a file exists in S3."""
+    # A missing key is the expected answer for every new upload, so it is handled inside
+    # the timed block; only real errors reach timed() and count as s3_head failures.
+    with timed("s3_head"):
+        try:
+            s3_client.head_object(Bucket=bucket, Key=key)
+            return True
+        except ClientError as e:
+            # Without s3:ListBucket S3 answers 403 rather than 404 for a missing key
+            if e.response["Error"]["Code"] in ("403", "Forbidden", "404", "NoSuchKey", "NotFound"):
+                return False
+            raise
+
+
+def upload_to_s3(s3_client, local_path, bucket, s3_key):
+    """Upload file to S3 if it doesn't already exist. Returns True when a file was uploaded."""
+    if file_exists_in_s3(s3_client, bucket, s3_key):
+        print(f"File already exists in S3: {s3_key}, skipping upload.")
+        return False
+    with timed("s3_upload"):
+        s3_client.upload_file(local_path, bucket, s3_key)
+    print(f"Uploaded to S3: {s3_key}")
+    return True
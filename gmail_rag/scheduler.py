@@ -0,0 +1,311 @@
+#This is the scheduler / daemon entry point for mail ingestion. It runs the PO and proforma download jobs
+# concurrently at configurable intervals, holds a per-job file lock so runs never overlap (also across processes),
+# retries failed messages with exponential backoff and resumes from the last processed UID after a restart.
+#
+# Run:  python scheduler.py                      # daemon, every 60 minutes
+#       python scheduler.py --once               # single run of both jobs (cron friendly)
+#       python scheduler.py --po-interval 15 --proforma-interval 30 --metrics-port 9108
+#
+# Sale bill workbooks are saved into sales_dash/Data and turned into Parquet by sales_dash/sales_etl.py; new PO dumps
+# and proforma invoices are reconciled against each other by reconcile.py.
+
+import argparse
+import imaplib
+import json
+import logging
+import os
+import random
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import schedule
+import streamlit as st
+
+import mail_ingest
+from instrumentation import configure_logging, count, log_event, start_metrics_server, timed
+from job_lock import JobLock
+from s3_utils import S3_BUCKET, make_s3_client, upload_to_s3
+
+STATE_DIRECTORY = "."  # checkpoint files (scheduler_state_<job>.json) and lock files live here
+DEFAULT_INTERVAL_MINUTES = 60
+
+RETRY_ATTEMPTS = 4  # per message, within one run
+RETRY_BASE_DELAY = 2.0  # seconds; doubled each attempt, plus jitter
+RETRY_MAX_DELAY = 60.0
+MAX_MESSAGE_RUNS = 5  # runs a failing message is carried over before it is given up on
+
+SALES_DASH_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "sales_dash")
+
+# What each job downloads and where it stores it (matches PO_s3store.py / proforma_s3store.py).
+# "index": False keeps a job out of the RAG indexes; "post_run" names a POST_RUN step to run after new attachments arrive.
+JOBS = {
+    "po": {"rule": mail_ingest.PO_RULE, "save_directory": "PO_Dump", "s3_folder": "PO_Dump/", "post_run": "reconcile"},
+    "proforma": {"rule": mail_ingest.PROFORMA_RULE, "save_directory": "proforma_invoice", "s3_folder": "proforma_invoice/",
+                 "post_run": "reconcile"},
+    "sales": {"rule": mail_ingest.SALE_BILLS_RULE, "save_directory": os.path.join(SALES_DASH_DIRECTORY, "Data"),
+              "s3_folder": "sale_bills/", "index": False, "post_run": "sales_etl"},
+}
+
+
+class MailboxChanged(imaplib.IMAP4.error):
+    """UIDVALIDITY changed across a reconnect: the run's UIDs no longer name the same messages."""
+
+
+def retry_with_backoff(func, *args, what="operation", attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY,
+                       max_delay=RETRY_MAX_DELAY, **kwargs):
+    """Call func, retrying on any exception with exponential backoff and jitter; re-raises the last error."""
+    for attempt in range(1, attempts + 1):
+        try:
+            return func(*args, **kwargs)
+        except MailboxChanged:
+            raise
+        except Exception as e:
+            if attempt == attempts:
+                raise
+            delay = min(max_delay, base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.5)
+            count("retries_total", what=what)
+            log_event("retrying", level=logging.WARNING, what=what, attempt=attempt, delay=round(delay, 2), error=repr(e))
+            time.sleep(delay)
+
+
+# Checkpoint per job: {"uidvalidity": int, "last_uid": int, "failed": {uid: runs}}
+def state_path(job_name, directory=STATE_DIRECTORY):
+    return os.path.join(directory, f"scheduler_state_{job_name}.json")
+
+
+def load_job_state(job_name, directory=STATE_DIRECTORY):
+    path = state_path(job_name, directory)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_job_state(job_name, job_state, directory=STATE_DIRECTORY):
+    """Write atomically so a crash never leaves a half-written checkpoint."""
+    path = state_path(job_name, directory)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(job_state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def store_attachment(job, filename, payload, s3_client):
+    """Default attachment handler: save locally and upload to S3 if not already there."""
+    os.makedirs(job["save_directory"], exist_ok=True)
+    local_path = os.path.join(job["save_directory"], filename)
+    if not os.path.exists(local_path):
+        with open(local_path, "wb") as f:
+            f.write(payload)
+        print(f"Saved locally: {local_path}")
+    if s3_client is not None:
+        retry_with_backoff(upload_to_s3, s3_client, local_path, S3_BUCKET, job["s3_folder"] + filename, what="s3_upload")
+
+
+def run_sales_etl():
+    """Incremental Parquet refresh for the sales dashboard; a separate process keeps pandas out of the daemon."""
+    with timed("sales_etl"):
+        subprocess.run([sys.executable, os.path.join(SALES_DASH_DIRECTORY, "sales_etl.py")], check=True,
+                       stdout=subprocess.DEVNULL)
+
+
+def run_reconcile():
+    """Re-match PO dumps against proforma invoices (reconcile.py); also a separate process."""
+    with timed("reconcile"):
+        subprocess.run([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "reconcile.py")],
+                       check=True, stdout=subprocess.DEVNULL)
+
+
+POST_RUN = {"sales_etl": run_sales_etl, "reconcile": run_reconcile}
+
+
+class ImapSession:
+    """The connection a run works on; reopened when the server drops it, as long as UIDVALIDITY is unchanged."""
+
+    def __init__(self, mail, uidvalidity, credentials=None):
+        self.mail = mail
+        self.uidvalidity = uidvalidity
+        self.credentials = credentials  # None: no reconnect, a dropped connection ends the run (idle_watcher)
+
+    def call(self, func, *args, **kwargs):
+        """func(mail, *args, **kwargs); after a dropped connection the error is re-raised on a fresh one."""
+        try:
+            return func(self.mail, *args, **kwargs)
+        except (imaplib.IMAP4.abort, OSError) as e:
+            if self.credentials is None:
+                raise
+            count("imap_reconnects_total")
+            log_event("imap_reconnecting", level=logging.WARNING, error=repr(e))
+            self.reconnect()
+            raise
+
+    def reconnect(self):
+        self.logout()
+        try:
+            self.mail = mail_ingest.connect_imap(*self.credentials)
+        except OSError as e:
+            # Still a lost connection to the caller, so the run stops instead of blaming the message
+            raise imaplib.IMAP4.abort(f"reconnect failed: {e!r}") from e
+        uidvalidity = mail_ingest.get_uidvalidity(self.mail)
+        if uidvalidity != self.uidvalidity:
+            raise MailboxChanged(f"UIDVALIDITY changed from {self.uidvalidity} to {uidvalidity}")
+
+    def logout(self):
+        try:
+            self.mail.logout()
+        except Exception:
+            pass
+
+
+def process_message(session, job_name, uid, handler):
+    msg = session.call(mail_ingest.fetch_message, uid)
+    for filename, payload in mail_ingest.iter_attachments(msg, JOBS[job_name]["rule"]):
+        handler(job_name, uid, filename, payload)
+
+
+def run_job(job_name, credentials, handler, directory=STATE_DIRECTORY):
+    """One run of a job: new UIDs since the checkpoint plus previously failed ones, each retried with backoff."""
+    lock = JobLock(f"scheduler_{job_name}", directory)
+    if not lock.acquire():
+        count("runs_skipped_total", job=job_name, reason="overlap")
+        log_event("run_skipped", level=logging.WARNING, job=job_name, reason="previous run still in progress")
+        return
+    try:
+        with timed("scheduled_run", job=job_name):
+            _run_job_locked(job_name, credentials, handler, directory)
+    except Exception as e:
+        count("runs_failed_total", job=job_name)
+        log_event("run_failed", level=logging.ERROR, exc_info=True, job=job_name, error=repr(e))
+    finally:
+        lock.release()
+
+
+def _run_job_locked(job_name, credentials, handler, directory):
+    mail = retry_with_backoff(mail_ingest.connect_imap, *credentials, what="imap_connect")
+    session = ImapSession(mail, mail_ingest.get_uidvalidity(mail), credentials)
+    try:
+        process_new_messages(session, job_name, handler, session.uidvalidity, directory)
+    finally:
+        session.logout()
+
+
+def process_new_messages(mail, job_name, handler, uidvalidity, directory=STATE_DIRECTORY):
+    """Process messages newer than the job's checkpoint (plus carried-over failures) on an open connection.
+
+    mail is an IMAP connection or an ImapSession that reconnects. A lost connection or a changed UIDVALIDITY
+    ends the run without counting against the message. The caller must hold the job's lock.
+    """
+    session = mail if isinstance(mail, ImapSession) else ImapSession(mail, uidvalidity)
+    rule = JOBS[job_name]["rule"]
+    job_state = load_job_state(job_name, directory)
+    if job_state.get("uidvalidity") != uidvalidity:
+        # Mailbox was rebuilt: old UIDs are meaningless, start over from the newest messages
+        job_state = {"uidvalidity": uidvalidity, "last_uid": 0, "failed": {}}
+        save_job_state(job_name, job_state, directory)
+
+    last_uid = job_state.get("last_uid", 0)
+    failed = dict(job_state.get("failed", {}))
+    if last_uid:
+        new_uids = retry_with_backoff(session.call, mail_ingest.search_uids, rule, since_uid=last_uid, limit=None,
+                                      what="imap_search")
+    else:
+        new_uids = retry_with_backoff(session.call, mail_ingest.search_uids, rule, what="imap_search")
+    uids = sorted({int(uid) for uid in new_uids} | {int(uid) for uid in failed})
+    log_event("run_started", job=job_name, new=len(new_uids), retrying=len(failed), last_uid=last_uid)
+
+    for uid in uids:
+        try:
+            retry_with_backoff(process_message, session, job_name, str(uid).encode(), handler, what="message")
+            failed.pop(str(uid), None)
+            count("messages_processed_total", corpus=job_name, status="ok")
+            if JOBS[job_name].get("post_run"):
+                job_state["post_run_pending"] = True
+        except (imaplib.IMAP4.abort, MailboxChanged):
+            raise
+        except Exception as e:
+            runs = failed.get(str(uid), 0) + 1
+            count("messages_processed_total", corpus=job_name, status="error")
+            if runs >= MAX_MESSAGE_RUNS:
+                failed.pop(str(uid), None)
+                log_event("message_given_up", level=logging.ERROR, job=job_name, uid=uid, runs=runs, error=repr(e))
+            else:
+                failed[str(uid)] = runs
+                log_event("message_failed", level=logging.ERROR, job=job_name, uid=uid, runs=runs, error=repr(e))
+        # Checkpoint after every message so a crash resumes where it stopped
+        job_state.update(last_uid=max(last_uid, uid), failed=failed)
+        last_uid = job_state["last_uid"]
+        save_job_state(job_name, job_state, directory)
+
+    # Kept pending across runs until the step succeeds, so a failed refresh is retried on the next run
+    if job_state.get("post_run_pending"):
+        step = JOBS[job_name]["post_run"]
+        try:
+            retry_with_backoff(POST_RUN[step], what=step)
+            job_state["post_run_pending"] = False
+            save_job_state(job_name, job_state, directory)
+        except Exception as e:
+            log_event("post_run_failed", level=logging.ERROR, job=job_name, step=step, error=repr(e))
+
+
+def load_credentials():
+    """IMAP credentials as (account, password, server) from Streamlit secrets, like the other scripts."""
+    return st.secrets["EMAIL_ACCOUNT"], st.secrets["EMAIL_PASSWORD"], mail_ingest.IMAP_SERVER
+
+
+def make_s3_handler():
+    s3_client = make_s3_client(st.secrets["AWS_ACCESS_KEY"], st.secrets["AWS_SECRET_KEY"])
+
+    def handler(job_name, uid, filename, payload):
+        store_attachment(JOBS[job_name], filename, payload, s3_client)
+
+    return handler
+
+
+def run_all_once(credentials, handler, executor):
+    futures = [executor.submit(run_job, job_name, credentials, handler) for job_name in JOBS]
+    for future in futures:
+        future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scheduled PO / proforma mail ingestion")
+    parser.add_argument("--once", action="store_true", help="run both jobs once and exit")
+    parser.add_argument("--po-interval", type=int, default=DEFAULT_INTERVAL_MINUTES, help="minutes between PO runs")
+    parser.add_argument("--proforma-interval", type=int, default=DEFAULT_INTERVAL_MINUTES,
+                        help="minutes between proforma runs")
+    parser.add_argument("--sales-interval", type=int, default=DEFAULT_INTERVAL_MINUTES,
+                        help="minutes between sale bill runs")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this port")
+    parser.add_argument("--enqueue", action="store_true",
+                        help="also queue stored attachments for extraction / indexing by work_queue.py workers")
+    args = parser.parse_args()
+
+    configure_logging()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    credentials = load_credentials()
+    if args.enqueue:
+        from work_queue import WorkQueue, make_queue_handler
+        handler = make_queue_handler(WorkQueue(), make_s3_client(st.secrets["AWS_ACCESS_KEY"], st.secrets["AWS_SECRET_KEY"]))
+    else:
+        handler = make_s3_handler()
+    executor = ThreadPoolExecutor(max_workers=len(JOBS))
+
+    run_all_once(credentials, handler, executor)
+    if args.once:
+        return
+
+    # Each tick only submits the job; overlapping ticks are dropped by the job lock
+    intervals = {"po": args.po_interval, "proforma": args.proforma_interval, "sales": args.sales_interval}
+    for job_name, minutes in intervals.items():
+        schedule.every(minutes).minutes.do(executor.submit, run_job, job_name, credentials, handler)
+    log_event("scheduler_started", intervals=intervals)
+    while True:
+        schedule.run_pending()
+        time.sleep(5)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#This module generates synthetic "PO Order" and "Proforma Invoice" mails with XLSX / PDF attachments of
+# configurable size, for the benchmarks and local testing without access to the real mailbox.
+
+import io
+import random
+from email.message import EmailMessage
+
+import pandas as pd
+
+VENDORS = [
+    "Cummins India Limited (CPG)",
+    "Tata Cummins Private Limited (TCP)",
+    "Eaton Industrial System Pvt. Ltd",
+    "Hoganas India Pvt. Ltd",
+    "Lear Automotive India Pvt. Ltd (Chakan)",
+    "Grupo Antolin India Private Limited",
+]
+ITEMS = ["Hex Bolt M10", "Gasket Kit", "Bearing 6205", "Hydraulic Hose", "Oil Seal", "Copper Washer", "Filter Element"]
+
+
+def po_number(i):
+    return f"45000{i:05d}"
+
+
+def make_po_rows(batch, rows, rng):
+    """PO dump rows shaped like the ERP export: one line item per row."""
+    records = []
+    for r in range(rows):
+        po = po_number(batch * rows + r // 3)  # a few line items per PO
+        qty = rng.randint(1, 500)
+        rate = round(rng.uniform(5, 5000), 2)
+        records.append({
+            "PO Number": po,
+            "Vendor": rng.choice(VENDORS),
+            "Item": rng.choice(ITEMS),
+            "Qty": qty,
+            "Rate": rate,
+            "Amount": round(qty * rate, 2),
+            "Status": rng.choice(["Pending", "Processed"]),
+        })
+    return records
+
+
+def make_po_workbook(batch, rows, seed=0):
+    """Return XLSX bytes for one PO dump."""
+    rng = random.Random(seed * 100003 + batch)
+    buffer = io.BytesIO()
+    pd.DataFrame(make_po_rows(batch, rows, rng)).to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+def make_proforma_lines(number, line_items, rng):
+    vendor = rng.choice(VENDORS)
+    lines = [
+        "PROFORMA INVOICE",
+        f"Invoice No: PI-{number:06d}",
+        f"PO No: {po_number(number)}",
+        f"Vendor: {vendor}",
+        "Item Qty Rate Amount",
+    ]
+    total = 0.0
+    for _ in range(line_items):
+        qty = rng.randint(1, 500)
+        rate = round(rng.uniform(5, 5000), 2)
+        amount = round(qty * rate, 2)
+        total += amount
+        lines.append(f"{rng.choice(ITEMS)} {qty} {rate:.2f} {amount:.2f}")
+    lines.append(f"Total: {total:.2f}")
+    return lines
+
+
+def _pdf_escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def make_pdf(lines, lines_per_page=60):
+    """Write a minimal text-only PDF (Helvetica, one line per text row) that pdfplumber can read."""
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+    objects = {1: "<< /Type /Catalog /Pages 2 0 R >>", 3: "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"}
+    kids = []
+    for n, page_lines in enumerate(pages):
+        page_id, content_id = 4 + 2 * n, 5 + 2 * n
+        stream = "BT /F1 10 Tf 12 TL 50 800 Td " + " ".join(f"({_pdf_escape(line)}) '" for line in page_lines) + " ET"
+        objects[content_id] = f"<< /Length {len(stream)} >>\nstream\n{stream}\nendstream"
+        objects[page_id] = (f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+                            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>")
+        kids.append(f"{page_id} 0 R")
+    objects[2] = f"<< /Type /Pages /Kids [{' '.join(kids)}] /Count {len(kids)} >>"
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = {}
+    for obj_id in sorted(objects):
+        offsets[obj_id] = out.tell()
+        out.write(f"{obj_id} 0 obj\n{objects[obj_id]}\nendobj\n".encode("latin-1"))
+    xref = out.tell()
+    size = max(objects) + 1
+    out.write(f"xref\n0 {size}\n0000000000 65535 f \n".encode())
+    for obj_id in range(1, size):
+        out.write(f"{offsets[obj_id]:010d} 00000 n \n".encode())
+    out.write(f"trailer\n<< /Size {size} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode())
+    return out.getvalue()
+
+
+def make_proforma_pdf(number, line_items, seed=0):
+    """Return PDF bytes for one proforma invoice."""
+    rng = random.Random(seed * 100003 + number)
+    return make_pdf(make_proforma_lines(number, line_items, rng))
+
+
+def make_mail(subject, filename, payload, maintype, subtype):
+    msg = EmailMessage()
+    msg["Subject"] = subject
+    msg["From"] = "erp@kalika.example"
+    msg["To"] = "orders@kalika.example"
+    msg.set_content(f"Please find attached {filename}.")
+    msg.add_attachment(payload, maintype=maintype, subtype=subtype, filename=filename)
+    return msg.as_bytes()
+
+
+def po_mail(batch, rows, seed=0):
+    subject = f"PO Order dump {batch}"
+    payload = make_po_workbook(batch, rows, seed)
+    return subject, make_mail(subject, f"PO Dump {batch}.xlsx", payload,
+                              "application", "vnd.openxmlformats-officedocument.spreadsheetml.sheet")
+
+
+def proforma_mail(number, line_items, seed=0):
+    subject = f"Proforma Invoice PI-{number:06d}"
+    payload = make_proforma_pdf(number, line_items, seed)
+    return subject, make_mail(subject, f"Proforma PI-{number:06d}.pdf", payload, "application", "pdf")
+
+
+def seed_mailbox(imap_server, po_mails=10, po_rows=200, proforma_mails=10, proforma_lines=20, seed=0):
+    """Load synthetic mails into a fake_imap.FakeImapServer; returns total attachment bytes."""
+    total = 0
+    for batch in range(po_mails):
+        subject, raw = po_mail(batch, po_rows, seed)
+        imap_server.add_message(subject, raw)
+        total += len(raw)
+    for number in range(proforma_mails):
+        subject, raw = proforma_mail(number, proforma_lines, seed)
+        imap_server.add_message(subject, raw)
+        total += len(raw)
+    return total
+
+
+def make_reconciliation_set(pos, lines_per_po=3, invoiced=0.7, mismatched=0.05, seed=0):
+    """Consistent PO dump rows and proforma invoices (as text lines) for reconcile.py.
+
+    About `invoiced` of the POs get an exact proforma; `mismatched` of those get a wrong quantity, a different
+    vendor or a mistyped PO number; the rest stay pending.
+    """
+    rng = random.Random(seed)
+    records = []
+    proformas = []
+    for i in range(pos):
+        po, vendor = po_number(i), rng.choice(VENDORS)
+        lines = []
+        for _ in range(lines_per_po):
+            qty, rate = rng.randint(1, 500), round(rng.uniform(5, 5000), 2)
+            lines.append((rng.choice(ITEMS), qty, rate))
+            records.append({"PO Number": po, "Vendor": vendor, "Item": lines[-1][0], "Qty": qty, "Rate": rate,
+                            "Amount": round(qty * rate, 2), "Status": "Pending"})
+        if rng.random() >= invoiced:
+            continue
+        if rng.random() < mismatched:
+            fault = rng.choice(["qty", "vendor", "po_number"])
+            if fault == "qty":
+                item, qty, rate = lines[0]
+                lines[0] = (item, qty + 1, rate)
+            elif fault == "vendor":
+                vendor = rng.choice([v for v in VENDORS if v != vendor])
+            else:
+                po = po[:-2] + po[-1] + po[-2]  # transposed digits
+        text = ["PROFORMA INVOICE", f"Invoice No: PI-{i:06d}", f"PO No: {po}", f"Vendor: {vendor}",
+                "Item Qty Rate Amount"]
+        text += [f"{item} {qty} {rate:.2f} {qty * rate:.2f}" for item, qty, rate in lines]
+        text.append(f"Total: {sum(round(qty * rate, 2) for _, qty, rate in lines):.2f}")
+        proformas.append(text)
+    return records, proformas
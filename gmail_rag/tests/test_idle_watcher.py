@@ -0,0 +1,64 @@
+import queue
+import threading
+import time
+from email.message import EmailMessage
+
+import idle_watcher
+from fake_imap import FakeImapServer
+from job_lock import JobLock
+
+
+class StopWatching(Exception):
+    pass
+
+
+def proforma_mail(filename):
+    msg = EmailMessage()
+    msg["Subject"] = "Proforma Invoice"
+    msg.set_content("Please find attached.")
+    msg.add_attachment(b"%PDF-1.4", maintype="application", subtype="pdf", filename=filename)
+    return msg.as_bytes()
+
+
+def watch_until_stopped(*args):
+    try:
+        idle_watcher.watch(*args)
+    except StopWatching:
+        pass
+
+
+def test_job_skipped_during_scheduler_run_is_retried(tmp_path, monkeypatch):
+    # Checkpoints and lock files live in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(idle_watcher, "SKIPPED_RETRY_SECONDS", 1)
+    stop = threading.Event()
+    catch_up = idle_watcher.catch_up
+
+    def stoppable_catch_up(*args):
+        if stop.is_set():
+            raise StopWatching()
+        return catch_up(*args)
+
+    monkeypatch.setattr(idle_watcher, "catch_up", stoppable_catch_up)
+    server = FakeImapServer().start()
+    handled = queue.Queue()
+    scheduler_run = JobLock("scheduler_proforma")
+    assert scheduler_run.acquire()
+
+    credentials = ("user", "password", "127.0.0.1", server.port, False)
+    watcher = threading.Thread(target=watch_until_stopped, daemon=True,
+                               args=(credentials, lambda job, uid, filename, payload: handled.put((job, filename)), 40))
+    watcher.start()
+    try:
+        time.sleep(0.5)
+        server.add_message("Proforma Invoice", proforma_mail("PI-1.pdf"))
+        time.sleep(1)  # the EXISTS arrives while the scheduler still holds the job
+        scheduler_run.release()
+        # Without a retry the mail would wait for the 40 s IDLE timeout
+        assert handled.get(timeout=5) == ("proforma", "PI-1.pdf")
+    finally:
+        stop.set()
+        server.add_message("Proforma Invoice", proforma_mail("PI-2.pdf"))  # wakes IDLE so the watcher stops
+        watcher.join(5)
+        server.shutdown()
+    assert not watcher.is_alive()
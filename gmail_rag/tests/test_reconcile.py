@@ -0,0 +1,70 @@
+import pandas as pd
+import pytest
+
+from reconcile import ReconciliationStore, match_documents
+
+
+def write_dump(path, rows):
+    pd.DataFrame(rows, columns=["PO No", "Vendor", "Item", "Qty", "Rate", "Amount"]).to_excel(path, index=False)
+
+
+def write_invoice(path, lines):
+    """A one-page text PDF, enough for pdfplumber."""
+    content = "BT /F1 10 Tf 50 800 Td 14 TL " + " ".join(f"({line}) Tj T*" for line in lines) + " ET"
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", "<< /Type /Pages /Kids [3 0 R] /Count 1 >>",
+               "<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] /Contents 4 0 R "
+               "/Resources << /Font << /F1 5 0 R >> >> >>",
+               f"<< /Length {len(content)} >>\nstream\n{content}\nendstream",
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    pdf, offsets = "%PDF-1.4\n", []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(pdf))
+        pdf += f"{number} 0 obj\n{body}\nendobj\n"
+    xref = len(pdf)
+    pdf += f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n"
+    pdf += "".join(f"{offset:010d} 00000 n \n" for offset in offsets)
+    pdf += f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n"
+    path.write_text(pdf)
+
+
+def reconcile(tmp_path, store):
+    store.sync_sources([str(tmp_path / "po")], [str(tmp_path / "proforma")])
+    return match_documents(*store.load()).set_index("key")
+
+
+@pytest.fixture
+def store(tmp_path):
+    (tmp_path / "po").mkdir()
+    (tmp_path / "proforma").mkdir()
+    return ReconciliationStore(str(tmp_path / "reconcile.db"))
+
+
+def test_po_repeated_in_daily_dumps_is_counted_once(tmp_path, store):
+    po = ["4500000001", "Tata Cummins Pvt Ltd"]
+    lines = [po + ["Hex Bolt", 10, 5.0, 50.0], po + ["Oil Seal", 2, 25.0, 50.0]]
+    write_dump(tmp_path / "po" / "PO_Dump_0101.xlsx", lines)
+    reconcile(tmp_path, store)
+    write_dump(tmp_path / "po" / "PO_Dump_0102.xlsx", lines + [["4500000002", "Eaton India", "Gasket", 4, 10.0, 40.0]])
+    write_invoice(tmp_path / "proforma" / "pi.pdf", ["Invoice No: PI-1", "PO No: 4500000001",
+                                                     "Vendor: Tata Cummins Private Limited", "Hex Bolt 10 5.00 50.00",
+                                                     "Oil Seal 2 25.00 50.00", "Total: 100.00"])
+
+    results = reconcile(tmp_path, store)
+
+    assert results.loc["po:4500000001", "po_amount"] == 100.0
+    assert results.loc["po:4500000001", "status"] == "matched"
+    assert results.loc["po:4500000002", "status"] == "pending"
+
+
+def test_newest_dump_wins_when_a_po_changes(tmp_path, store):
+    write_dump(tmp_path / "po" / "b_old.xlsx", [["4500000001", "Eaton India", "Gasket", 4, 10.0, 40.0]])
+    reconcile(tmp_path, store)
+    # Sorts before the first dump by name, but was processed later
+    write_dump(tmp_path / "po" / "a_new.xlsx", [["4500000001", "Eaton India", "Gasket", 5, 10.0, 50.0]])
+    write_invoice(tmp_path / "proforma" / "pi.pdf", ["Invoice No: PI-2", "PO No: 4500000001", "Vendor: Eaton India",
+                                                     "Gasket 5 10.00 50.00"])
+
+    results = reconcile(tmp_path, store)
+
+    assert results.loc["po:4500000001", "po_amount"] == 50.0
+    assert results.loc["po:4500000001", "status"] == "matched"
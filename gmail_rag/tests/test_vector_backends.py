@@ -0,0 +1,98 @@
+import os
+import sqlite3
+import uuid
+
+import numpy as np
+import pytest
+from langchain_core.embeddings import Embeddings
+
+from chunk_store import INDEX_FILE
+from vector_backends import PGVECTOR_DSN, FaissBackend, PgvectorBackend, chunk_id
+
+DIMENSION = 16
+
+
+class NoEmbeddings(Embeddings):
+    """The tests pass vectors directly; nothing should ask the backend to embed."""
+
+    def embed_documents(self, texts):
+        raise AssertionError("unexpected embed_documents call")
+
+    def embed_query(self, text):
+        raise AssertionError("unexpected embed_query call")
+
+
+def make_chunks(count, seed=0):
+    """(texts and vectors, metadatas, ids) for count chunks spread over two source files."""
+    vectors = np.random.default_rng(seed).random((count, DIMENSION), dtype=np.float32)
+    texts = [f"PO {i} line" for i in range(count)]
+    metadatas = [{"source": "a.xlsx" if i % 2 else "b.xlsx", "row": i} for i in range(count)]
+    ids = [chunk_id(text, metadata) for text, metadata in zip(texts, metadatas)]
+    return list(zip(texts, vectors.tolist())), metadatas, ids
+
+
+@pytest.fixture
+def pgvector_backend():
+    psycopg = pytest.importorskip("psycopg")
+    pytest.importorskip("pgvector")
+    pytest.importorskip("psycopg_pool")
+    try:
+        psycopg.connect(PGVECTOR_DSN, connect_timeout=3).close()
+    except psycopg.OperationalError:
+        pytest.skip(f"PGVECTOR_DSN not reachable: {PGVECTOR_DSN}")
+    backend = PgvectorBackend(f"test_{uuid.uuid4().hex[:8]}", NoEmbeddings())
+    yield backend
+    backend.drop()
+
+
+def test_pgvector_copy_ingestion_is_idempotent(pgvector_backend):
+    text_embeddings, metadatas, ids = make_chunks(20)
+
+    assert pgvector_backend.add_embeddings(text_embeddings, metadatas, ids) == 20
+    assert pgvector_backend.add_embeddings(text_embeddings, metadatas, ids) == 0
+    # A batch mixing stored and new chunks only adds the new ones
+    more, more_metadatas, more_ids = make_chunks(25)
+    assert pgvector_backend.add_embeddings(more, more_metadatas, more_ids) == 5
+    assert pgvector_backend.existing_ids(more_ids) == set(more_ids)
+
+
+def test_pgvector_metadata_filter(pgvector_backend):
+    text_embeddings, metadatas, ids = make_chunks(20)
+    pgvector_backend.add_embeddings(text_embeddings, metadatas, ids)
+
+    hits = pgvector_backend.search_by_vector(text_embeddings[0][1], k=20, filter={"source": "a.xlsx"})
+    assert len(hits) == 10
+    assert {doc.metadata["source"] for doc, _ in hits} == {"a.xlsx"}
+    assert pgvector_backend.source_ids("b.xlsx") == {doc_id for doc_id, m in zip(ids, metadatas)
+                                                     if m["source"] == "b.xlsx"}
+
+
+def test_pgvector_scores_match_faiss(pgvector_backend, tmp_path):
+    text_embeddings, metadatas, ids = make_chunks(50)
+    pgvector_backend.add_embeddings(text_embeddings, metadatas, ids)
+    faiss_backend = FaissBackend(str(tmp_path / "index"), NoEmbeddings())
+    faiss_backend.add_embeddings(text_embeddings, metadatas, ids)
+
+    query = np.random.default_rng(1).random(DIMENSION, dtype=np.float32).tolist()
+    pg_hits = pgvector_backend.search_by_vector(query, k=5)
+    faiss_hits = faiss_backend.search_by_vector(query, k=5)
+
+    # Both report squared L2 distances, so QueryService can merge hits from either backend
+    assert [doc.page_content for doc, _ in pg_hits] == [doc.page_content for doc, _ in faiss_hits]
+    assert [score for _, score in pg_hits] == pytest.approx([score for _, score in faiss_hits], rel=1e-4)
+
+
+def test_faiss_refresh_closes_replaced_store(tmp_path):
+    backend = FaissBackend(str(tmp_path / "index"), NoEmbeddings())
+    text_embeddings, metadatas, ids = make_chunks(10)
+    backend.add_embeddings(text_embeddings[:5], metadatas[:5], ids[:5])
+    assert backend.refresh()
+    first = backend.store
+
+    backend.add_embeddings(text_embeddings[5:], metadatas[5:], ids[5:])
+    os.utime(os.path.join(backend.path, INDEX_FILE), ns=(0, 0))
+    assert backend.refresh()
+    assert backend.store is not first
+    with pytest.raises(sqlite3.ProgrammingError):
+        first.docstore.db.execute("SELECT 1")
+    assert len(backend.search_by_vector(text_embeddings[0][1], k=10)) == 10
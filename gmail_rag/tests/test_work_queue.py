@@ -0,0 +1,79 @@
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pytest
+from langchain_core.embeddings import Embeddings
+
+import indexer
+from vector_backends import get_backend
+from work_queue import WorkQueue, embed_stage, extract_stage, index_stage
+
+
+class HashEmbeddings(Embeddings):
+    """Small deterministic embedder; the tests only care about which chunks are stored."""
+
+    def _embed(self, text):
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:4], "little")
+        return np.random.default_rng(seed).random(16, dtype=np.float32).tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def write_dump(path, po_numbers):
+    pd.DataFrame({"PO No": po_numbers, "Vendor": ["Acme"] * len(po_numbers)}).to_excel(path, index=False)
+    return path.read_bytes()
+
+
+def run_stages(queue, embeddings):
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        extract_stage(queue, pool, 10)
+    embed_stage(queue, embeddings, 10)
+    index_stage(queue, embeddings, 10)
+
+
+def indexed_texts(embeddings, source):
+    backend = get_backend("po", embeddings, index_path=indexer.CORPUS_INDEX_PATHS["po"])
+    hits = backend.search_by_vector(embeddings.embed_query("PO"), k=50, filter={"source": source})
+    return " ".join(doc.page_content for doc, _ in hits)
+
+
+@pytest.fixture
+def queue(tmp_path, monkeypatch):
+    # Index and lock files are written relative to the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(indexer, "CORPUS_INDEX_PATHS", {"po": str(tmp_path / "po_index")})
+    return WorkQueue(str(tmp_path / "work_queue.db"))
+
+
+@pytest.mark.parametrize("same_batch", [False, True])
+def test_resent_attachment_replaces_older_version(queue, tmp_path, same_batch):
+    embeddings = HashEmbeddings()
+    path = tmp_path / "PO_Dump.xlsx"
+
+    queue.enqueue("po", str(path), write_dump(path, ["PO-1001", "PO-1002"]))
+    if not same_batch:
+        run_stages(queue, embeddings)
+        assert "PO-1001" in indexed_texts(embeddings, "PO_Dump.xlsx")
+    queue.enqueue("po", str(path), write_dump(path, ["PO-2001"]))
+    run_stages(queue, embeddings)
+
+    texts = indexed_texts(embeddings, "PO_Dump.xlsx")
+    assert "PO-2001" in texts
+    assert "PO-1001" not in texts
+    assert queue.status() == {("po", "indexed"): 2}
+
+
+def test_queue_and_index_file_agree_on_chunk_ids(queue, tmp_path):
+    embeddings = HashEmbeddings()
+    path = tmp_path / "PO_Dump.xlsx"
+    queue.enqueue("po", str(path), write_dump(path, ["PO-1001"]))
+    run_stages(queue, embeddings)
+
+    # Indexing the same file directly finds every chunk already stored under the same ids
+    assert indexer.index_file("po", str(path), embeddings) == 0
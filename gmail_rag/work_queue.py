@@ -0,0 +1,333 @@
+#This module is a durable SQLite work queue between ingestion, extraction, embedding and indexing. Every stored
+# attachment becomes a job that moves fetched -> extracted -> embedded -> indexed; each stage claims jobs with a
+# lease, runs with its own concurrency and commits its output together with the state change. A crashed worker's
+# lease simply expires and the job is picked up again, and every stage is safe to repeat.
+#
+# Run workers:  python work_queue.py --extract-workers 4 --embed-batch 16
+# Show status:  python work_queue.py --status
+
+import argparse
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from instrumentation import configure_logging, count, log_event, start_metrics_server, timed
+
+QUEUE_PATH = "work_queue.db"
+FILES_DIRECTORY = "work_queue_files"  # next to the queue database; content-addressed copies of queued attachments
+LEASE_SECONDS = 300  # a job whose worker died becomes claimable again after this
+MAX_ATTEMPTS = 5  # per stage, then the job is parked in state "failed"
+POLL_INTERVAL = 1.0
+
+# stage name -> (state it consumes, state it produces)
+STAGES = {
+    "extract": ("fetched", "extracted"),
+    "embed": ("extracted", "embedded"),
+    "index": ("embedded", "indexed"),
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY,
+    corpus TEXT NOT NULL,
+    source_key TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_state ON jobs (state, lease_expires);
+CREATE TABLE IF NOT EXISTS chunks (
+    job_id INTEGER NOT NULL REFERENCES jobs (id),
+    seq INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    vector BLOB,
+    PRIMARY KEY (job_id, seq)
+);
+"""
+
+
+class WorkQueue:
+    """Job table + chunk table in one SQLite file; one connection per thread."""
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self.local = threading.local()
+        self.worker_id = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.connection().executescript(SCHEMA)
+
+    def connection(self):
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self.local.conn = conn
+        return conn
+
+    def enqueue(self, corpus, path, payload=None):
+        """Add an attachment; the same content for the same corpus is only queued once.
+
+        With payload, the job reads a copy stored under FILES_DIRECTORY/<sha256>/<file name> instead of path:
+        the attachment at path may be an older file with the same name (store_attachment never overwrites).
+        """
+        copy = payload is not None
+        if not copy:
+            with open(path, "rb") as f:
+                payload = f.read()
+        digest = hashlib.sha256(payload).hexdigest()
+        if copy:
+            path = self.store_payload(digest, os.path.basename(path), payload)
+        source_key = f"{corpus}:{digest}"
+        now = time.time()
+        cursor = self.connection().execute(
+            "INSERT OR IGNORE INTO jobs (corpus, source_key, path, state, created_at, updated_at) "
+            "VALUES (?, ?, ?, 'fetched', ?, ?)",
+            (corpus, source_key, path, now, now),
+        )
+        if cursor.rowcount:
+            count("queue_enqueued_total", corpus=corpus)
+            return cursor.lastrowid
+        return None
+
+    def store_payload(self, digest, filename, payload):
+        directory = os.path.join(os.path.dirname(os.path.abspath(self.path)), FILES_DIRECTORY, digest)
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(payload)
+            os.replace(tmp_path, path)
+        return path
+
+    def claim(self, stage, limit=1):
+        """Lease up to limit jobs waiting for the stage."""
+        from_state, _ = STAGES[stage]
+        conn = self.connection()
+        now = time.time()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT * FROM jobs WHERE state = ? AND (lease_expires IS NULL OR lease_expires < ?) "
+                "ORDER BY id LIMIT ?",
+                (from_state, now, limit),
+            ).fetchall()
+            for row in rows:
+                conn.execute(
+                    "UPDATE jobs SET lease_owner = ?, lease_expires = ?, attempts = attempts + 1, updated_at = ? "
+                    "WHERE id = ?",
+                    (self.worker_id, now + LEASE_SECONDS, now, row["id"]),
+                )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        # attempts as counted by this claim
+        return [dict(row, attempts=row["attempts"] + 1) for row in rows]
+
+    def complete(self, stage, job_ids, chunk_updates=None):
+        """Advance leased jobs to the stage's output state, writing any chunk data in the same transaction.
+
+        chunk_updates: list of SQL (statement, params) run before the state change.
+        """
+        _, to_state = STAGES[stage]
+        conn = self.connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for statement, params in chunk_updates or []:
+                conn.execute(statement, params)
+            conn.executemany(
+                "UPDATE jobs SET state = ?, attempts = 0, lease_owner = NULL, lease_expires = NULL, "
+                "last_error = NULL, updated_at = ? WHERE id = ? AND lease_owner = ?",
+                [(to_state, time.time(), job_id, self.worker_id) for job_id in job_ids],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        count("queue_stage_completed_total", len(job_ids), stage=stage)
+
+    def fail(self, stage, job, error):
+        """Release the lease for a retry, or park the job once it has used up its attempts."""
+        parked = job["attempts"] >= MAX_ATTEMPTS
+        self.connection().execute(
+            "UPDATE jobs SET state = CASE WHEN ? THEN 'failed' ELSE state END, lease_owner = NULL, "
+            "lease_expires = NULL, last_error = ?, updated_at = ? WHERE id = ? AND lease_owner = ?",
+            (parked, repr(error), time.time(), job["id"], self.worker_id),
+        )
+        count("queue_stage_failed_total", stage=stage, parked=parked)
+        log_event("queue_job_failed", level=logging.ERROR, stage=stage, job_id=job["id"], path=job["path"],
+                  attempts=job["attempts"], parked=parked, error=repr(error))
+
+    def chunks(self, job_ids, with_vectors=False):
+        marks = ",".join("?" * len(job_ids))
+        return self.connection().execute(
+            f"SELECT job_id, seq, text{', vector' if with_vectors else ''} FROM chunks "
+            f"WHERE job_id IN ({marks}) ORDER BY job_id, seq",
+            job_ids,
+        ).fetchall()
+
+    def status(self):
+        rows = self.connection().execute("SELECT corpus, state, COUNT(*) AS n FROM jobs GROUP BY corpus, state")
+        return {(row["corpus"], row["state"]): row["n"] for row in rows}
+
+
+def extract_chunks(path):
+    """Runs in a worker process: extract and split one attachment."""
+    from extractors import extract_text, split_text
+    return split_text(extract_text(path))
+
+
+def extract_stage(queue, pool, batch_size):
+    jobs = queue.claim("extract", batch_size)
+    futures = [(job, pool.submit(extract_chunks, job["path"])) for job in jobs]
+    for job, future in futures:
+        try:
+            with timed("queue_extract", corpus=job["corpus"]):
+                chunks = future.result()
+            updates = [("DELETE FROM chunks WHERE job_id = ?", (job["id"],))]
+            updates += [
+                ("INSERT INTO chunks (job_id, seq, text) VALUES (?, ?, ?)", (job["id"], seq, text))
+                for seq, text in enumerate(chunks)
+            ]
+            queue.complete("extract", [job["id"]], updates)
+        except Exception as e:
+            queue.fail("extract", job, e)
+    return len(jobs)
+
+
+def embed_stage(queue, embeddings, batch_size):
+    """Embed the chunks of several jobs in one model call."""
+    jobs = queue.claim("embed", batch_size)
+    if not jobs:
+        return 0
+    try:
+        rows = queue.chunks([job["id"] for job in jobs])
+        with timed("queue_embed"):
+            vectors = embeddings.embed_documents([row["text"] for row in rows]) if rows else []
+        updates = [
+            ("UPDATE chunks SET vector = ? WHERE job_id = ? AND seq = ?",
+             (np.asarray(vector, dtype=np.float32).tobytes(), row["job_id"], row["seq"]))
+            for row, vector in zip(rows, vectors)
+        ]
+        queue.complete("embed", [job["id"] for job in jobs], updates)
+    except Exception as e:
+        for job in jobs:
+            queue.fail("embed", job, e)
+    return len(jobs)
+
+
+def index_stage(queue, embeddings, batch_size):
+    """Replace the chunks of many embedded jobs' attachments in their corpus index with one load/save of the index."""
+    from indexer import replace_sources
+
+    jobs = queue.claim("index", batch_size)
+    for corpus in {job["corpus"] for job in jobs}:
+        corpus_jobs = [job for job in jobs if job["corpus"] == corpus]
+        try:
+            # A re-sent attachment replaces the older version under its file name; in one batch the newest job wins
+            latest = {os.path.basename(job["path"]): job["id"] for job in sorted(corpus_jobs, key=lambda j: j["id"])}
+            sources = {job_id: source for source, job_id in latest.items()}
+            documents = {source: [] for source in latest}
+            for row in queue.chunks(list(sources), with_vectors=True):
+                documents[sources[row["job_id"]]].append(
+                    (row["text"], np.frombuffer(row["vector"], dtype=np.float32).tolist()))
+            with timed("queue_index", corpus=corpus):
+                # Content-hash ids make a repeated index step (crash after saving the index) a no-op
+                replace_sources(corpus, documents, embeddings)
+            queue.complete("index", [job["id"] for job in corpus_jobs])
+        except Exception as e:
+            for job in corpus_jobs:
+                queue.fail("index", job, e)
+    return len(jobs)
+
+
+def stage_loop(name, step, stop_event, poll_interval=POLL_INTERVAL):
+    """Run a stage until stopped; sleeps only when there was nothing to do."""
+    while not stop_event.is_set():
+        try:
+            processed = step()
+        except Exception as e:
+            log_event("stage_loop_error", level=logging.ERROR, exc_info=True, stage=name, error=repr(e))
+            processed = 0
+        if not processed:
+            stop_event.wait(poll_interval)
+
+
+def run_workers(queue, embeddings, extract_workers=2, extract_batch=4, embed_batch=8, index_batch=64,
+                stop_event=None):
+    """Start one thread per stage (extraction fans out to a process pool) and block until stop_event is set."""
+    stop_event = stop_event or threading.Event()
+    pool = ProcessPoolExecutor(max_workers=extract_workers)
+    threads = [
+        threading.Thread(target=stage_loop, args=("extract", lambda: extract_stage(queue, pool, extract_batch), stop_event)),
+        threading.Thread(target=stage_loop, args=("embed", lambda: embed_stage(queue, embeddings, embed_batch), stop_event)),
+        threading.Thread(target=stage_loop, args=("index", lambda: index_stage(queue, embeddings, index_batch), stop_event)),
+    ]
+    for thread in threads:
+        thread.start()
+    log_event("queue_workers_started", extract_workers=extract_workers, embed_batch=embed_batch)
+    try:
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(1)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        pool.shutdown()
+
+
+def make_queue_handler(queue, s3_client):
+    """Ingestion handler for scheduler.py / idle_watcher.py: store the attachment, then enqueue it."""
+    import scheduler
+
+    def handler(job_name, uid, filename, payload):
+        job = scheduler.JOBS[job_name]
+        scheduler.store_attachment(job, filename, payload, s3_client)
+        if job.get("index", True):
+            queue.enqueue(job_name, os.path.join(job["save_directory"], filename), payload)
+
+    return handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Extraction / embedding / indexing workers over the work queue")
+    parser.add_argument("--queue", default=QUEUE_PATH)
+    parser.add_argument("--status", action="store_true", help="print job counts per state and exit")
+    parser.add_argument("--extract-workers", type=int, default=2, help="processes for PDF / Excel extraction")
+    parser.add_argument("--extract-batch", type=int, default=4)
+    parser.add_argument("--embed-batch", type=int, default=8, help="jobs embedded per model call")
+    parser.add_argument("--index-batch", type=int, default=64, help="jobs added per index rewrite")
+    parser.add_argument("--metrics-port", type=int, default=None)
+    args = parser.parse_args()
+
+    queue = WorkQueue(args.queue)
+    if args.status:
+        for (corpus, state), n in sorted(queue.status().items()):
+            print(f"{corpus:<10} {state:<10} {n}")
+        return
+
+    configure_logging()
+    if args.metrics_port:
+        start_metrics_server(args.metrics_port)
+    from indexer import get_embeddings
+    run_workers(queue, get_embeddings(), args.extract_workers, args.extract_batch, args.embed_batch, args.index_batch)
+
+
+if __name__ == "__main__":
+    main()
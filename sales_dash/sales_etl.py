@@ -0,0 +1,295 @@
+#This module turns the monthly sale bill workbooks (Tally "Sales Register" exports such as APRIL 24 SALE BILLS.xlsx)
+# into a partitioned Parquet dataset plus small pre-aggregated rollups, so the Power BI dashboard reads compact
+# columnar tables instead of re-parsing every XLSX on refresh. Only workbooks whose content changed since the last
+# run are parsed (sha256 manifest); sale bills arriving by mail are dropped into Data/ by gmail_rag/scheduler.py.
+#
+# Output (default sales_dash/parquet/):
+#   sales/year=YYYY/month=MM/<source>.parquet   one row per bill, partitioned by bill month
+#   rollups/daily.parquet, customer_monthly.parquet, product_monthly.parquet
+#   manifest.json                               processed files, their hashes, parts and any schema errors
+#
+# Run: python sales_etl.py [--input Data] [--output parquet] [--force]
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import pandas as pd
+import pyarrow as pa
+
+BASE_DIRECTORY = os.path.dirname(os.path.abspath(__file__))
+DATA_DIRECTORY = os.path.join(BASE_DIRECTORY, "Data")
+OUTPUT_DIRECTORY = os.path.join(BASE_DIRECTORY, "parquet")
+WORKBOOK_EXTENSIONS = (".xlsx", ".xls")
+
+# Sales Register columns -> dataset columns
+REQUIRED_COLUMNS = {
+    "Date": "date",
+    "Particulars": "customer",
+    "GSTR2A Status": "voucher_type",
+    "Vch No.": "voucher_no",
+    "Credit": "amount",
+}
+# Item-wise register exports also carry these; the product rollup stays empty for bill-level registers
+OPTIONAL_COLUMNS = {
+    "Stock Item": "product",
+    "Item": "product",
+    "Product": "product",
+    "Quantity": "quantity",
+    "Qty": "quantity",
+}
+# Fixed so part files written from different workbooks always read back as one dataset
+DATASET_SCHEMA = pa.schema([
+    ("date", pa.timestamp("ms")),
+    ("customer", pa.string()),
+    ("voucher_type", pa.string()),
+    ("voucher_no", pa.string()),
+    ("amount", pa.float64()),
+    ("product", pa.string()),
+    ("quantity", pa.float64()),
+    ("source_file", pa.string()),
+    ("ingested_at", pa.timestamp("us", tz="UTC")),
+])
+DATASET_COLUMNS = DATASET_SCHEMA.names
+HEADER_SEARCH_ROWS = 20  # title rows (company, "Sales Register", period) come before the header
+
+
+class SchemaError(ValueError):
+    """A workbook does not look like a Sales Register export."""
+
+    def __init__(self, path, problems):
+        super().__init__(f"{os.path.basename(path)}: " + "; ".join(problems))
+        self.problems = problems
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def load_manifest(output_directory):
+    path = os.path.join(output_directory, "manifest.json")
+    if not os.path.exists(path):
+        return {"files": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest, output_directory):
+    """Write atomically so a crash never leaves a half-written manifest."""
+    path = os.path.join(output_directory, "manifest.json")
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def find_header_row(raw):
+    for i in range(min(HEADER_SEARCH_ROWS, len(raw))):
+        values = {str(value).strip() for value in raw.iloc[i].dropna()}
+        if {"Date", "Particulars"} <= values:
+            return i
+    return None
+
+
+def parse_dates(values):
+    """Excel serials, datetimes and '1-Apr-24' style strings all occur in exports."""
+    numeric = pd.to_numeric(values, errors="coerce")
+    serials = pd.to_datetime(numeric, unit="D", origin="1899-12-30", errors="coerce")
+    text = values.where(numeric.isna())
+    iso = pd.to_datetime(text, errors="coerce", format="ISO8601")
+    # Tally prints Indian day-first dates, so anything that is not ISO is read day-first
+    parsed = pd.to_datetime(text.where(iso.isna()), errors="coerce", dayfirst=True, format="mixed")
+    return serials.fillna(iso).fillna(parsed)
+
+
+def read_sale_bills(path):
+    """Parse and validate one workbook into dataset rows; raises SchemaError listing every problem found."""
+    raw = pd.read_excel(path, header=None)
+    header_row = find_header_row(raw)
+    if header_row is None:
+        raise SchemaError(path, ["no header row with Date / Particulars"])
+    header = [str(value).strip() for value in raw.iloc[header_row]]
+    missing = [column for column in REQUIRED_COLUMNS if column not in header]
+    if missing:
+        raise SchemaError(path, [f"missing columns: {', '.join(missing)}"])
+
+    df = raw.iloc[header_row + 1:].copy()
+    df.columns = header
+    columns = {**{c: n for c, n in OPTIONAL_COLUMNS.items() if c in header}, **REQUIRED_COLUMNS}
+    df = df[list(columns)].rename(columns=columns)
+    df = df.loc[:, ~df.columns.duplicated()]
+    # The register ends with a "Total:" line and may contain blank spacer rows
+    df = df[df["voucher_no"].notna() & ~df["date"].astype(str).str.strip().str.startswith("Total")]
+
+    problems = []
+    df["date"] = parse_dates(df["date"])
+    df["amount"] = pd.to_numeric(df["amount"], errors="coerce").astype("float64")
+    for column, label in (("date", "unparsable dates"), ("amount", "non-numeric amounts")):
+        bad = df[df[column].isna()]
+        if len(bad):
+            problems.append(f"{len(bad)} {label} (e.g. voucher {bad['voucher_no'].iloc[0]})")
+    # Item-wise registers repeat the voucher on every line; bill-level registers must not
+    duplicated = df["voucher_no"][df["voucher_no"].duplicated()] if "product" not in df else []
+    if len(duplicated):
+        problems.append(f"duplicate voucher numbers: {', '.join(map(str, duplicated.unique()[:5]))}")
+    if df.empty:
+        problems.append("no bills")
+    if problems:
+        raise SchemaError(path, problems)
+
+    for column in ("product", "quantity"):
+        if column not in df:
+            df[column] = None
+    df["customer"] = df["customer"].astype(str).str.strip()
+    df["voucher_type"] = df["voucher_type"].astype(str).str.strip()
+    df["voucher_no"] = df["voucher_no"].astype(str).str.strip()
+    df["product"] = df["product"].astype("string")
+    df["quantity"] = pd.to_numeric(df["quantity"], errors="coerce").astype("float64")
+    df["source_file"] = os.path.basename(path)
+    df["ingested_at"] = pd.Timestamp.now(tz="UTC")
+    return df[DATASET_COLUMNS].reset_index(drop=True)
+
+
+def write_partitions(df, output_directory, source_hash):
+    """Write one part file per bill month (Hive layout, readable by pandas / pyarrow / Power BI)."""
+    parts = []
+    for (year, month), rows in df.groupby([df["date"].dt.year, df["date"].dt.month]):
+        directory = os.path.join(output_directory, "sales", f"year={year}", f"month={month:02d}")
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{source_hash[:16]}.parquet")
+        rows.to_parquet(path, index=False, schema=DATASET_SCHEMA)
+        parts.append(os.path.relpath(path, output_directory))
+    return parts
+
+
+def remove_parts(parts, output_directory):
+    for part in parts:
+        path = os.path.join(output_directory, part)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def load_dataset(output_directory):
+    """All bill rows; a voucher re-sent in a later workbook replaces the earlier copy (all of its lines)."""
+    sales_directory = os.path.join(output_directory, "sales")
+    if not os.path.isdir(sales_directory):
+        return pd.DataFrame(columns=DATASET_COLUMNS)
+    df = pd.read_parquet(sales_directory, columns=DATASET_COLUMNS)
+    df = df[df["ingested_at"] == df.groupby("voucher_no")["ingested_at"].transform("max")]
+    return df.sort_values(["date", "voucher_no"]).reset_index(drop=True)
+
+
+def build_rollups(df):
+    if df.empty:
+        return {"daily": pd.DataFrame(columns=["date", "bills", "amount", "customers"]),
+                "customer_monthly": pd.DataFrame(columns=["month", "customer", "bills", "amount"]),
+                "product_monthly": pd.DataFrame(columns=["month", "product", "bills", "quantity", "amount"])}
+    month = df["date"].dt.to_period("M").dt.to_timestamp()
+    daily = (df.groupby(df["date"].dt.normalize())
+               .agg(bills=("voucher_no", "nunique"), amount=("amount", "sum"), customers=("customer", "nunique"))
+               .reset_index())
+    customer_monthly = (df.assign(month=month)
+                          .groupby(["month", "customer"])
+                          .agg(bills=("voucher_no", "nunique"), amount=("amount", "sum"))
+                          .reset_index())
+    products = df[df["product"].notna()]
+    product_monthly = (products.assign(month=month[products.index])
+                               .groupby(["month", "product"])
+                               .agg(bills=("voucher_no", "nunique"), quantity=("quantity", "sum"),
+                                    amount=("amount", "sum"))
+                               .reset_index())
+    return {"daily": daily, "customer_monthly": customer_monthly, "product_monthly": product_monthly}
+
+
+def write_rollups(output_directory):
+    directory = os.path.join(output_directory, "rollups")
+    os.makedirs(directory, exist_ok=True)
+    rollups = build_rollups(load_dataset(output_directory))
+    for name, table in rollups.items():
+        tmp_path = os.path.join(directory, f"{name}.parquet.tmp")
+        table.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, os.path.join(directory, f"{name}.parquet"))
+    return {name: len(table) for name, table in rollups.items()}
+
+
+def find_workbooks(input_directories):
+    paths = []
+    for directory in input_directories:
+        if not os.path.isdir(directory):
+            continue
+        for filename in sorted(os.listdir(directory)):
+            if filename.lower().endswith(WORKBOOK_EXTENSIONS) and not filename.startswith("~$"):
+                paths.append(os.path.abspath(os.path.join(directory, filename)))
+    return paths
+
+
+def run_etl(input_directories=(DATA_DIRECTORY,), output_directory=OUTPUT_DIRECTORY, force=False):
+    """Ingest new / changed workbooks, drop data of deleted ones and rebuild the rollups if anything changed."""
+    os.makedirs(output_directory, exist_ok=True)
+    if force:
+        shutil.rmtree(os.path.join(output_directory, "sales"), ignore_errors=True)
+        manifest = {"files": {}}
+    else:
+        manifest = load_manifest(output_directory)
+    files = manifest["files"]
+    summary = {"ingested": 0, "unchanged": 0, "rejected": 0, "duplicate": 0, "removed": 0}
+
+    digests = {path: file_hash(path) for path in find_workbooks(input_directories)}
+    # Deleted and changed workbooks give up their parts before anything is ingested, so no copy below is
+    # recorded as a duplicate of data that is about to go away
+    parts_removed = False
+    for path in [p for p, e in files.items() if digests.get(p) != e["sha256"]]:
+        entry = files.pop(path, None)
+        if entry is None:
+            continue
+        parts_removed = parts_removed or bool(entry.get("parts"))
+        remove_parts(entry.get("parts", []), output_directory)
+        if path not in digests:
+            summary["removed"] += 1
+        # Copies skipped as duplicates of this workbook are ingested in its place below
+        for other in [o for o, e in files.items() if e.get("duplicate_of") == path]:
+            del files[other]
+
+    for path, digest in digests.items():
+        if path in files:
+            summary["unchanged"] += 1
+            continue
+        # The same workbook saved twice (e.g. once from Data/ and once from mail) is only ingested once
+        twin = next((other for other, e in files.items() if e["sha256"] == digest and e.get("parts")), None)
+        record = {"sha256": digest, "processed_at": datetime.now(timezone.utc).isoformat(), "parts": []}
+        if twin:
+            record.update(status="duplicate", duplicate_of=twin)
+            summary["duplicate"] += 1
+        else:
+            try:
+                df = read_sale_bills(path)
+                record.update(status="ok", rows=len(df), parts=write_partitions(df, output_directory, digest))
+                summary["ingested"] += 1
+                print(f"Ingested {os.path.basename(path)}: {len(df)} rows")
+            except SchemaError as e:
+                record.update(status="rejected", errors=e.problems)
+                summary["rejected"] += 1
+                print(f"Rejected {e}")
+        files[path] = record
+        save_manifest(manifest, output_directory)
+
+    if summary["ingested"] or parts_removed or force or not os.path.isdir(os.path.join(output_directory, "rollups")):
+        summary["rollups"] = write_rollups(output_directory)
+    save_manifest(manifest, output_directory)
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sale bill workbooks -> partitioned Parquet + rollups")
+    parser.add_argument("--input", action="append", default=None, help="workbook directory (repeatable)")
+    parser.add_argument("--output", default=OUTPUT_DIRECTORY)
+    parser.add_argument("--force", action="store_true", help="re-ingest every workbook")
+    args = parser.parse_args()
+    print(json.dumps(run_etl(args.input or [DATA_DIRECTORY], args.output, args.force), indent=2))